@@ -1,11 +1,13 @@
+import hashlib
+import json
+import os
+import time
+import uuid
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
-from essay_analyzer import IELTSEssayAnalyzer
-from html import escape
-from bs4 import BeautifulSoup
-from pprint import pprint
+from essay_analyzer import PROFILES, IELTSEssayAnalyzer
+from history_store import HistoryStore
+from highlighting import highlight_text_with_errors
 
 st.set_page_config(
     page_title="IELTS Essay Analyzer",
@@ -61,57 +63,197 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-def highlight_text_with_errors(text: str, errors: list[dict]) -> str:
-    highlighted_text = escape(text)
-    offset = 0
+SCORE_AXIS = dict(
+    tickmode='array',
+    ticktext=[str(i/2) for i in range(0, 19)],
+    tickvals=[i/2 for i in range(0, 19)],
+)
+
+
+@st.cache_resource
+def get_analyzer(profile: str = "thorough") -> IELTSEssayAnalyzer:
+    """One analyzer (and one set of LLM clients) per profile, shared by every session in the process."""
+    return IELTSEssayAnalyzer(profile=profile)
+
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    return HistoryStore(os.environ.get("IELTS_HISTORY_DB", "ielts_history.db"))
+
+
+HISTORY_WINDOWS = {"Last 30 days": 30, "Last 90 days": 90, "All time": None}
+
+
+def results_key(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# The chart builders below take a content hash as their only hashed argument; the
+# underscore-prefixed data arguments are skipped by st.cache_data, so a rerun with
+# unchanged results returns the cached figure without touching pandas or plotly. Both are
+# imported on first use, so the page renders before they load.
+@st.cache_data(max_entries=64)
+def build_score_chart(key: str, _scores: list[dict]):
+    import pandas as pd
+    import plotly.express as px
+
+    score_df = pd.DataFrame({
+        'Criterion': [score['Name'] for score in _scores],
+        'Score': [score['Score'] for score in _scores]
+    })
+
+    fig = px.bar(score_df, x='Criterion', y='Score',
+                range_y=[0, 9],
+                title='IELTS Assessment')
+
+    fig.update_layout(
+        yaxis=dict(
+            **SCORE_AXIS,
+            gridcolor='rgba(0,0,0,0.1)',
+            zeroline=True,
+            zerolinecolor='rgba(0,0,0,0.2)'
+        ),
+        plot_bgcolor='white'
+    )
+    return fig
+
+
+@st.cache_data(max_entries=64)
+def build_error_chart(key: str, _errors: list[dict]):
+    import pandas as pd
+    import plotly.express as px
+
+    error_counts = pd.DataFrame({
+        'Criterion': [error['Criterion'] for error in _errors]
+    }).value_counts().reset_index()
+    error_counts.columns = ['Criterion', 'Number of Errors']
+
+    return px.pie(error_counts, names='Criterion', values='Number of Errors',
+                  title='Distribution of Errors by Criterion')
+
+
+@st.cache_data(max_entries=64)
+def build_progress_charts(key: str, _progress_rows: list[dict]):
+    import pandas as pd
+    import plotly.express as px
+
+    progress_data = pd.DataFrame(_progress_rows).rename(columns={'Grammatical Range and Accuracy': 'Grammar'})
+
+    cols_to_numeric = ['Overall Score', 'Task Response', 'Coherence and Cohesion', 'Lexical Resource', 'Grammar']
+    for col in cols_to_numeric:
+        progress_data[col] = pd.to_numeric(progress_data[col], errors='coerce')
+
+    fig_progress = px.line(progress_data, x='Date', y='Overall Score',
+                         title='Overall Score Progress',
+                         labels={'Overall Score': 'IELTS Score'},
+                         markers=True)
+    fig_progress.update_layout(yaxis=dict(**SCORE_AXIS, range=[0, 9]))
+
+    progress_data_melted = progress_data.melt(id_vars=['Date'],
+                                              value_vars=['Task Response', 'Coherence and Cohesion', 'Lexical Resource', 'Grammar'],
+                                              var_name='Criterion', value_name='Score')
 
-    for error in errors:
-        error_text = error['error_text']
-        start = text.find(error_text) 
-        if start == -1:
-            print(f'Error text "{error_text}" not found in the text')
-            continue  
+    criterion_progress = px.line(
+        progress_data_melted,
+        x='Date',
+        y='Score',
+        color='Criterion',
+        title='Progress by Criterion',
+        labels={'Score': 'Score'},
+        markers=True
+    )
+    criterion_progress.update_layout(yaxis=dict(**SCORE_AXIS, range=[0, 9]))
+    return fig_progress, criterion_progress
 
-        end = start + len(error_text)
 
-        highlight_html = f'<span class="error-highlight"> {error_text} <span class="tooltip-text"> <b style=\'align: center;\'>{error["description"]}</b> </span> </span>'
-        highlighted_text = highlighted_text[:start] + highlight_html + highlighted_text[end:]
-        offset += len(highlight_html) - len(error_text)
-        #print(f'Error: {error_text}, start: {start}, end: {end}, offset: {offset}')
-    return f'<div>{highlighted_text}</div>'
+def show_pre_analysis(stats: dict) -> None:
+    st.markdown("### Essay Statistics")
+    words, paragraphs, sentences, diversity, linking = st.columns(5)
+    words.metric("Words", stats['word_count'],
+                 delta=f"{stats['word_count'] - stats['minimum_words']} vs {stats['minimum_words']} minimum",
+                 delta_color="normal")
+    paragraphs.metric("Paragraphs", stats['paragraph_count'])
+    sentences.metric("Avg. sentence length", f"{stats['sentence_length']['mean']:.1f}",
+                     help=f"{stats['sentence_count']} sentences, "
+                          f"{stats['sentence_length']['min']}-{stats['sentence_length']['max']} words")
+    diversity.metric("Lexical diversity (MATTR)", f"{stats['lexical_diversity']['mattr']:.2f}",
+                     help=f"Type-token ratio {stats['lexical_diversity']['type_token_ratio']:.2f}")
+    linking.metric("Linking words / 100 words", f"{stats['linking_words']['per_100_words']:.1f}",
+                   help=", ".join(f"{item['phrase']} x{item['count']}" for item in stats['linking_words']['most_used']))
+    if stats['under_minimum']:
+        st.warning(f"The essay has {stats['word_count']} words; IELTS Task 2 requires at least {stats['minimum_words']}.")
+    if stats['repeated_ngrams']:
+        st.caption("Repeated phrases: " + ", ".join(f"“{item['ngram']}” ×{item['count']}"
+                                                     for item in stats['repeated_ngrams']))
 
-analyzer = IELTSEssayAnalyzer()
 
 st.title("IELTS Essay Analyzer")
 
 main_col = st.container()
 sidebar = st.sidebar
 
+profile = sidebar.radio(
+    "Analysis depth", PROFILES, index=PROFILES.index("thorough"), horizontal=True,
+    help="fast: one model call (a few seconds); standard: separate suggestions per criterion; "
+         "thorough: standard plus a verification pass.")
+analyzer = get_analyzer(profile)
+
+# History is kept per student ID; without one it is tied to this browser session.
+student_id = sidebar.text_input("Student ID", help="Enter the same ID each time to keep your progress history")
+if not student_id:
+    student_id = st.session_state.setdefault('anonymous_id', f"anonymous-{uuid.uuid4()}")
+history = get_history_store()
+
 with main_col:
     essay_topic = st.text_input("Essay Topic")
     essay_text = st.text_area("Enter your essay here", height=300)
     
     if st.button("Analyze Essay"):
         if essay_text and essay_topic:
+            # Local statistics are shown at once, while the LLM analysis is still running.
+            show_pre_analysis(analyzer.pre_analyze(essay_text))
+
+            live_placeholder = st.empty()
+            live_scores = live_placeholder.container()
+
+            def show_criterion(criterion: dict) -> None:
+                # Evaluator scores arrive one criterion at a time while the rest of the pipeline runs.
+                live_scores.write(f"**{criterion['Name']}**: {criterion['Score']:.1f}")
+
             with st.spinner("Analyzing your essay..."):
-                scores, errors = analyzer.analyze_essay(essay_text, essay_topic)
+                live_scores.markdown("### Scores")
+                # A resubmitted edit of the last essay only has its changed passages re-evaluated.
+                scores, errors = analyzer.analyze_essay(essay_text, essay_topic, on_criterion=show_criterion,
+                                                        previous=st.session_state.get('last_analysis'))
+                live_placeholder.empty()
                 
                 st.session_state['scores'] = scores
                 st.session_state['errors'] = errors
+                if scores:
+                    st.session_state['last_analysis'] = {
+                        'essay': analyzer.sanitize_input(essay_text), 'topic': essay_topic,
+                        'profile': analyzer.profile, 'scores': scores, 'errors': errors,
+                    }
                 
                 if len(scores) > 0:
+                    history.append(student_id, scores, profile=analyzer.profile)
+
                     overall_score = sum(score['Score'] for score in scores) / len(scores)
                     overall_score = round(overall_score * 2) / 2 
                     
                     st.markdown("### Overall Score")
                     st.write(f"**{overall_score:.1f}**")
+                    st.caption(f"Analyzed with the {analyzer.profile} profile")
                     
                     for score in scores:
                         st.write(f"**{score['Name']}**: {score['Score']:.1f}")
 
                     st.markdown("### Your Essay with Annotations")
-                    highlighted_text = highlight_text_with_errors(essay_text, errors)
+                    # Error offsets refer to the sanitized essay; map them back onto what the student typed.
+                    _, offset_map = analyzer.sanitize_with_offsets(essay_text)
+                    highlighted_text = highlight_text_with_errors(essay_text, errors, offset_map)
 
+                    from bs4 import BeautifulSoup
                     soup = BeautifulSoup(highlighted_text, 'html.parser')
                     clean_html = str(soup)
 
@@ -176,108 +318,17 @@ with sidebar:
     if 'scores' in st.session_state and len(st.session_state['scores']) > 0:
         scores = st.session_state['scores']
         
-        score_df = pd.DataFrame({
-            'Criterion': [score['Name'] for score in scores],
-            'Score': [score['Score'] for score in scores]
-        })
-        
-        fig = px.bar(score_df, x='Criterion', y='Score',
-                    range_y=[0, 9],
-                    title='IELTS Assessment')
-        
-        fig.update_layout(
-            yaxis=dict(
-                tickmode='array',
-                ticktext=[str(i/2) for i in range(0, 19)],
-                tickvals=[i/2 for i in range(0, 19)],
-                gridcolor='rgba(0,0,0,0.1)',
-                zeroline=True,
-                zerolinecolor='rgba(0,0,0,0.2)'
-            ),
-            plot_bgcolor='white'
-        )
+        fig = build_score_chart(results_key([(score['Name'], score['Score']) for score in scores]), scores)
         st.plotly_chart(fig, use_container_width=True)
         
         st.markdown("### Error Analysis")
         if 'errors' in st.session_state:
             errors = st.session_state['errors']
-            error_counts = pd.DataFrame({
-                'Criterion': [error['Criterion'] for error in errors]
-            }).value_counts().reset_index()
-            error_counts.columns = ['Criterion', 'Number of Errors']
-            
-            fig_errors = px.pie(error_counts, names='Criterion', values='Number of Errors',
-                              title='Distribution of Errors by Criterion')
+            fig_errors = build_error_chart(results_key([error['Criterion'] for error in errors]), errors)
             st.plotly_chart(fig_errors, use_container_width=True)
         
-        st.markdown("### Progress Tracking")
-
-        if 'progress_data' not in st.session_state:
-            st.session_state['progress_data'] = pd.DataFrame({
-                'Date': [datetime.now()],
-                'Overall Score': [sum(score['Score'] for score in scores) / len(scores)],
-                'Task Response': [next((s['Score'] for s in scores if s['Name'] == 'Task Response'), None)],
-                'Coherence and Cohesion': [next((s['Score'] for s in scores if s['Name'] == 'Coherence and Cohesion'), None)],
-                'Lexical Resource': [next((s['Score'] for s in scores if s['Name'] == 'Lexical Resource'), None)],
-                'Grammar': [next((s['Score'] for s in scores if s['Name'] == 'Grammatical Range & Accuracy'), None)]
-            })
-        else:
-            new_data = pd.DataFrame({
-                'Date': [datetime.now()],
-                'Overall Score': [sum(score['Score'] for score in scores) / len(scores)],
-                'Task Response': [next((s['Score'] for s in scores if s['Name'] == 'Task Response'), None)],
-                'Coherence and Cohesion': [next((s['Score'] for s in scores if s['Name'] == 'Coherence and Cohesion'), None)],
-                'Lexical Resource': [next((s['Score'] for s in scores if s['Name'] == 'Lexical Resource'), None)],
-                'Grammar': [next((s['Score'] for s in scores if s['Name'] == 'Grammatical Range & Accuracy'), None)]
-            })
-            st.session_state['progress_data'] = pd.concat([st.session_state['progress_data'], new_data], ignore_index=True)
-
-        progress_data = st.session_state['progress_data']
-
-        cols_to_numeric = ['Overall Score', 'Task Response', 'Coherence and Cohesion', 'Lexical Resource', 'Grammar']
-        for col in cols_to_numeric:
-            progress_data[col] = pd.to_numeric(progress_data[col], errors='coerce')
-
-        fig_progress = px.line(progress_data, x='Date', y='Overall Score',
-                             title='Overall Score Progress',
-                             labels={'Overall Score': 'IELTS Score'},
-                             markers=True)
-
-        fig_progress.update_layout(
-            yaxis=dict(
-                tickmode='array',
-                ticktext=[str(i/2) for i in range(0, 19)],
-                tickvals=[i/2 for i in range(0, 19)],
-                range=[0, 9]
-            )
-        )
-        st.plotly_chart(fig_progress, use_container_width=True)
-
-        progress_data_melted = progress_data.melt(id_vars=['Date'],
-                                                  value_vars=['Task Response', 'Coherence and Cohesion', 'Lexical Resource', 'Grammar'],
-                                                  var_name='Criterion', value_name='Score')
-
-        criterion_progress = px.line(
-            progress_data_melted,
-            x='Date',
-            y='Score',
-            color='Criterion',
-            title='Progress by Criterion',
-            labels={'Score': 'Score'},
-            markers=True
-        )
-
-        criterion_progress.update_layout(
-            yaxis=dict(
-                tickmode='array',
-                ticktext=[str(i/2) for i in range(0, 19)],
-                tickvals=[i/2 for i in range(0, 19)],
-                range=[0, 9]
-            )
-        )
-        st.plotly_chart(criterion_progress, use_container_width=True)
-
         if st.button("Export Analysis Report"):
+            import pandas as pd
             report = pd.DataFrame({
                 'Criterion': [score['Name'] for score in scores],
                 'Score': [score['Score'] for score in scores],
@@ -291,3 +342,15 @@ with sidebar:
                 file_name=f"ielts_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv"
             )
+
+    st.markdown("### Progress Tracking")
+    window = st.selectbox("History", list(HISTORY_WINDOWS), index=0)
+    days = HISTORY_WINDOWS[window]
+    # At most 100 points are read, however many attempts the student has.
+    progress_rows = history.progress(student_id, since=time.time() - days * 86400 if days else None, max_points=100)
+    if progress_rows:
+        fig_progress, criterion_progress = build_progress_charts(results_key(progress_rows), progress_rows)
+        st.plotly_chart(fig_progress, use_container_width=True)
+        st.plotly_chart(criterion_progress, use_container_width=True)
+    else:
+        st.caption("No analyses in this period yet.")
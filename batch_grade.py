@@ -0,0 +1,194 @@
+"""Grade a JSONL corpus of essays offline.
+
+Each input line is a JSON object with ``id``, ``topic`` and ``essay``. Results are
+appended to the output JSONL as soon as each essay finishes, and the ids of
+finished essays are appended to a checkpoint file, so an interrupted run picks up
+where it stopped when started again with the same arguments:
+
+    python batch_grade.py essays.jsonl graded.jsonl --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Set
+
+from essay_analyzer import PROFILES, IELTSEssayAnalyzer
+from rate_limiter import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, RateLimitScheduler, priority
+from result_cache import ResultCache
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield input records lazily; malformed lines are reported and skipped."""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"{path}:{line_number}: skipping malformed line: {e}", file=sys.stderr)
+                continue
+            if not all(key in record for key in ('id', 'topic', 'essay')):
+                print(f"{path}:{line_number}: skipping record without id/topic/essay", file=sys.stderr)
+                continue
+            yield record
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+class Throughput:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.tokens = 0
+        self.consecutive_failures = 0
+
+    def line(self) -> str:
+        minutes = max(time.monotonic() - self.started, 1e-9) / 60
+        attempted = self.completed + self.failed
+        error_rate = self.failed / attempted if attempted else 0.0
+        return (f"done={self.completed} failed={self.failed} "
+                f"essays/min={self.completed / minutes:.1f} tokens/min={self.tokens / minutes:.0f} "
+                f"error_rate={error_rate:.1%}")
+
+
+class BatchRunner:
+    def __init__(self, analyzer: IELTSEssayAnalyzer, output_path: str, checkpoint_path: str,
+                 concurrency: int = 8, report_interval: float = 10.0,
+                 max_consecutive_failures: Optional[int] = None):
+        self.analyzer = analyzer
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = max(1, concurrency)
+        self.report_interval = report_interval
+        self.max_consecutive_failures = max_consecutive_failures
+        self.stats = Throughput()
+        self.aborted = False
+
+    async def _grade(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        # Interactive calls sharing the analyzer's rate limiter go first.
+        with priority("batch"):
+            report = await self.analyzer.analyze_report_async(record['essay'], record['topic'])
+        self.stats.tokens += report['metrics']['total_tokens']
+        scores = report['scores']
+        overall = round(sum(score['Score'] for score in scores) / len(scores) * 2) / 2 if scores else None
+        return {
+            'id': record['id'],
+            'overall': overall,
+            'profile': report['profile'],
+            'ensemble': report['ensemble'],
+            'scores': scores,
+            'errors': report['errors'],
+            'metrics': report['metrics'],
+            'graded_at': datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def _worker(self, queue: asyncio.Queue, output, checkpoint) -> None:
+        while True:
+            record = await queue.get()
+            if record is None:
+                return
+            try:
+                result = await self._grade(record)
+            except Exception as e:
+                self.stats.failed += 1
+                self.stats.consecutive_failures += 1
+                print(f"{record['id']}: {type(e).__name__}: {e}", file=sys.stderr)
+                if (self.max_consecutive_failures is not None
+                        and self.stats.consecutive_failures >= self.max_consecutive_failures):
+                    self.aborted = True
+                continue
+            # The result line goes out before the checkpoint entry: a crash in between
+            # regrades that essay on resume rather than losing it.
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+            checkpoint.write(f"{record['id']}\n")
+            checkpoint.flush()
+            self.stats.completed += 1
+            self.stats.consecutive_failures = 0
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.stats.line(), file=sys.stderr)
+
+    async def run(self, records: Iterator[Dict[str, Any]]) -> Throughput:
+        done = load_checkpoint(self.checkpoint_path)
+        if done:
+            print(f"Resuming: {len(done)} essays already graded", file=sys.stderr)
+
+        # A small bounded queue keeps memory flat regardless of corpus size.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        with open(self.output_path, 'a', encoding='utf-8') as output, \
+                open(self.checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            workers = [asyncio.create_task(self._worker(queue, output, checkpoint))
+                       for _ in range(self.concurrency)]
+            reporter = asyncio.create_task(self._report())
+            try:
+                for record in records:
+                    if self.aborted:
+                        print(f"Aborting after {self.stats.consecutive_failures} consecutive failures; "
+                              f"rerun to resume", file=sys.stderr)
+                        break
+                    if str(record['id']) in done:
+                        continue
+                    await queue.put(record)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                reporter.cancel()
+        print(self.stats.line(), file=sys.stderr)
+        return self.stats
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Grade a JSONL file of IELTS Task 2 essays.")
+    parser.add_argument('input', help="JSONL file with id, topic and essay fields")
+    parser.add_argument('output', help="JSONL file results are appended to")
+    parser.add_argument('--checkpoint', help="file of finished ids (default: <output>.done)")
+    parser.add_argument('--concurrency', type=int, default=8, help="essays graded at once")
+    parser.add_argument('--model', default="gpt-4o-mini")
+    parser.add_argument('--profile', choices=PROFILES, default="thorough",
+                        help="fast: one call per essay; standard: no verifier; thorough: full chain")
+    parser.add_argument('--suggestion-cache', metavar='PATH',
+                        help="SQLite file of per-error suggestions reused across essays and runs")
+    parser.add_argument('--sharded', action='store_true',
+                        help="evaluate the four criteria with concurrent per-criterion calls")
+    parser.add_argument('--ensemble', type=int, default=1, metavar='N',
+                        help="draw N evaluator samples in one request and report median scores and their spread")
+    parser.add_argument('--rpm', type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="OpenAI requests per minute this run may use; leave headroom for the app")
+    parser.add_argument('--tpm', type=float, default=DEFAULT_TOKENS_PER_MINUTE,
+                        help="OpenAI tokens per minute this run may use")
+    parser.add_argument('--report-interval', type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument('--max-consecutive-failures', type=int, default=20,
+                        help="stop (resumably) after this many failures in a row, e.g. when rate limited")
+    args = parser.parse_args(argv)
+
+    suggestion_cache = ResultCache(path=args.suggestion_cache) if args.suggestion_cache else None
+    runner = BatchRunner(IELTSEssayAnalyzer(model=args.model, profile=args.profile,
+                                            evaluation_mode="sharded" if args.sharded else "single",
+                                            suggestion_cache=suggestion_cache, ensemble_samples=args.ensemble,
+                                            rate_limiter=RateLimitScheduler(args.rpm, args.tpm)), args.output,
+                         args.checkpoint or f"{args.output}.done",
+                         concurrency=args.concurrency,
+                         report_interval=args.report_interval,
+                         max_consecutive_failures=args.max_consecutive_failures)
+    asyncio.run(runner.run(read_records(args.input)))
+    return 2 if runner.aborted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Cold-start benchmark: import time and resident memory of each entry point.
+
+Every sample runs in a fresh interpreter, so nothing is cached in sys.modules:
+
+- ``analyzer``: ``import essay_analyzer``
+- ``ui``: the top-level imports of app.py (running the script itself needs a Streamlit server)
+- ``batch``: ``import batch_grade``
+
+Each result also lists which of the heavy optional modules the scenario loaded.
+
+    python -m benchmarks.bench_import --output bench_import.json
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from benchmarks.bench_pipeline import _git_commit, _result
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("langchain_openai", "langchain_community", "openai", "httpx", "numpy", "pandas", "plotly", "bs4")
+
+# Runs in the child interpreter: times the imports, then reports peak RSS in KiB and the heavy
+# modules loaded. ru_maxrss survives fork/exec on Linux (it would report the parent's peak), so
+# the per-process VmHWM is read from /proc where available.
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+exec(compile({source!r}, "<imports>", "exec"))
+seconds = time.perf_counter() - started
+try:
+    with open("/proc/self/status") as f:
+        rss_kib = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+except OSError:
+    rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_kib": rss_kib,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def app_imports() -> str:
+    """The top-level import statements of app.py."""
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+SCENARIOS = {
+    "analyzer": lambda: "import essay_analyzer",
+    "ui": app_imports,
+    "batch": lambda: "import batch_grade",
+}
+
+
+def _sample(source: str) -> Dict[str, Any]:
+    probe = _PROBE.format(source=source, heavy=HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_scenario(name: str, repeats: int) -> List[Dict[str, Any]]:
+    source = SCENARIOS[name]()
+    baseline = _sample("pass")
+    samples = [_sample(source) for _ in range(repeats)]
+    loaded = samples[-1]["loaded"]
+    return [
+        _result(f"import_{name}_seconds", statistics.median(s["seconds"] for s in samples), "s", repeats=repeats),
+        _result(f"import_{name}_rss", statistics.median(s["rss_kib"] for s in samples) / 1024, "MiB",
+                repeats=repeats, loaded=loaded),
+        _result(f"import_{name}_rss_added", statistics.median(s["rss_kib"] - baseline["rss_kib"] for s in samples) / 1024,
+                "MiB", repeats=repeats),
+    ]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time and memory.")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), nargs='+', default=list(SCENARIOS))
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.scenario:
+        results += bench_scenario(name, args.repeats)
+
+    report = json.dumps({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "params": {"repeats": args.repeats},
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+"""Connection reuse benchmark: per-client pools vs. the shared keep-alive pool.
+
+A local HTTP server stands in for the OpenAI API. It answers chat completion
+requests with the offline FakeChatModel's synthetic output and sleeps
+``--handshake`` seconds whenever a new connection is opened, imitating the TLS
+handshake a real API connection costs. Each scenario grades ``--essays`` essays
+with a new analyzer per essay (as separate app sessions or workers would):
+
+- ``separate``: ChatOpenAI with its default HTTP clients and retry settings
+- ``shared``: all models and analyzers use transport.shared_pool()
+- ``shared_warm``: as ``shared``, after IELTSEssayAnalyzer.warm_up()
+
+    python -m benchmarks.bench_transport --output bench_transport.json
+"""
+import argparse
+import json
+import platform
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from langchain_openai import ChatOpenAI
+
+from benchmarks.bench_pipeline import _git_commit, _result, make_essay
+from essay_analyzer import IELTSEssayAnalyzer, openai_chat_model
+from fake_llm import (_extract_essay, detect_stage, synthetic_criterion, synthetic_evaluation,
+                      synthetic_suggestions, synthetic_verification)
+from transport import HTTPPool
+
+
+def _completion(prompt: str) -> str:
+    stage = detect_stage(prompt)
+    if stage == "suggestions":
+        return json.dumps(synthetic_suggestions(prompt))
+    if stage == "verifier":
+        return json.dumps(synthetic_verification(prompt))
+    if stage == "criterion":
+        return json.dumps(synthetic_criterion(prompt))
+    return json.dumps(synthetic_evaluation(_extract_essay(prompt)))
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    handshake = 0.0
+    latency = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with _StandInHandler.lock:
+            _StandInHandler.connections += 1
+        time.sleep(self.handshake)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        text = _completion(body['messages'][-1]['content'])
+        time.sleep(self.latency)
+        payload = json.dumps({
+            "id": "chatcmpl-local", "object": "chat.completion", "created": int(time.time()), "model": body['model'],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": len(text) // 4,
+                      "total_tokens": 100 + len(text) // 4},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _separate_clients_model(model: str, temperature: float, base_url: str) -> ChatOpenAI:
+    return ChatOpenAI(model=model, temperature=temperature, base_url=base_url, openai_api_key="sk-local")
+
+
+def _run_scenario(name: str, base_url: str, essays: int, **options: Any) -> List[Dict[str, Any]]:
+    warm = options.pop('warm', False)
+    before = _StandInHandler.connections
+    timings = []
+    for index in range(essays):
+        analyzer = IELTSEssayAnalyzer(profile="standard", **options)
+        if warm and index == 0:
+            analyzer.warm_up(connections=analyzer.max_suggestion_concurrency, base_url=base_url)
+        started = time.perf_counter()
+        analyzer.analyze_report(make_essay(300, seed=index), "Technology in education")
+        timings.append(time.perf_counter() - started)
+    connections = _StandInHandler.connections - before
+    return [
+        _result(f"transport_{name}_first", timings[0], "s"),
+        _result(f"transport_{name}_total", sum(timings), "s", essays=essays),
+        _result(f"transport_{name}_connections", connections, "count", essays=essays),
+    ]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark HTTP connection reuse against a local API stand-in.")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    parser.add_argument('--essays', type=int, default=5)
+    parser.add_argument('--handshake', type=float, default=0.1, help="seconds added to every new connection")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per completion")
+    args = parser.parse_args(argv)
+
+    _StandInHandler.handshake = args.handshake
+    _StandInHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    results = []
+    results += _run_scenario("separate", base_url, args.essays,
+                             chat_model_factory=partial(_separate_clients_model, base_url=base_url),
+                             coalesce_requests=False)
+    shared = partial(openai_chat_model, base_url=base_url, openai_api_key="sk-local")
+    results += _run_scenario("shared", base_url, args.essays, chat_model_factory=shared,
+                             http_pool=HTTPPool(retry_rate_limits=False), coalesce_requests=False)
+    results += _run_scenario("shared_warm", base_url, args.essays, chat_model_factory=shared,
+                             http_pool=HTTPPool(retry_rate_limits=False), coalesce_requests=False, warm=True)
+    server.shutdown()
+
+    report = json.dumps({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "params": {"essays": args.essays, "handshake": args.handshake, "latency": args.latency},
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+"""Combine several evaluator samples of one essay into a single evaluation.
+
+The samples come from one request with the API's ``n`` parameter. Scores are
+gathered into a (samples x criteria) NumPy matrix, snapped to the band scale
+(or another grid of valid scores) and reduced per criterion to a median (the reported score) and a spread
+(highest minus lowest band, 0.0 when all samples agree), which callers can
+use as a confidence signal. Errors of a criterion are merged across samples
+when their spans overlap; a merged error is kept when at least
+``min_support`` samples reported it.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from essay_analyzer import CRITERIA, normalize_criterion, normalize_error_pattern
+
+BAND_SCORES = np.arange(0.0, 9.5, 0.5)
+
+
+def _as_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def snap_scores(scores: Any, grid: Sequence[float] = BAND_SCORES) -> np.ndarray:
+    """Snap scores to the nearest value of ``grid`` (the 0.0-9.0 bands by default), ties going to the lower one.
+
+    Scores outside the grid snap to its ends; NaN and non-numbers are treated as 0.0.
+    """
+    try:
+        values = np.asarray(scores, dtype=float)
+    except (TypeError, ValueError):
+        values = np.array([_as_float(score) for score in scores], dtype=float)
+    values = np.nan_to_num(values, nan=0.0)
+    grid = np.unique(np.asarray(grid, dtype=float))
+    if grid.size == 1:
+        return np.full(values.shape, grid[0])
+    upper = np.clip(np.searchsorted(grid, values), 1, grid.size - 1)
+    lower = upper - 1
+    return np.where(values - grid[lower] <= grid[upper] - values, grid[lower], grid[upper])
+
+
+def score_matrix(evaluations: Sequence[dict], criteria: Sequence[str] = CRITERIA) -> np.ndarray:
+    """Scores of each sample (rows) per criterion (columns), NaN where a sample lacks the criterion."""
+    columns = {normalize_criterion(criterion): index for index, criterion in enumerate(criteria)}
+    matrix = np.full((len(evaluations), len(criteria)), np.nan)
+    for row, evaluation in enumerate(evaluations):
+        for item in evaluation.get("results", []):
+            column = columns.get(normalize_criterion(item.get("Name", ""))) if isinstance(item, dict) else None
+            if column is not None:
+                matrix[row, column] = _as_float(item.get("Score"))
+    return matrix
+
+
+def aggregate_scores(matrix: np.ndarray, grid: Sequence[float] = BAND_SCORES) -> Dict[str, np.ndarray]:
+    """Per-column median (snapped to ``grid``), spread and sample count of a score matrix; NaN entries are ignored."""
+    present = ~np.isnan(matrix)
+    snapped = np.where(present, snap_scores(matrix, grid), np.nan)
+    counts = present.sum(axis=0)
+    # Columns without any sample would make nanmedian warn; they are zero-filled and masked afterwards.
+    filled = np.where(counts > 0, snapped, 0.0)
+    median = snap_scores(np.nanmedian(filled, axis=0), grid)
+    spread = np.nanmax(filled, axis=0) - np.nanmin(filled, axis=0)
+    return {
+        'median': np.where(counts > 0, median, np.nan),
+        'spread': np.where(counts > 0, spread, np.nan),
+        'samples': counts,
+    }
+
+
+def _span(error: dict) -> Optional[Tuple[int, int]]:
+    start, end = error.get("start"), error.get("end")
+    if isinstance(start, int) and isinstance(end, int) and 0 <= start < end:
+        return start, end
+    return None
+
+
+def merge_errors(error_lists: Sequence[List[dict]], min_support: int = 1) -> List[dict]:
+    """Merge one criterion's errors from several samples; errors whose spans overlap are one error.
+
+    Errors without a usable span are matched by their normalized text. Each
+    kept error is the member overlapping most of its group, with 'support'
+    set to the number of samples that reported it.
+    """
+    spanned, unspanned = [], {}
+    for sample, errors in enumerate(error_lists):
+        for error in errors:
+            if not isinstance(error, dict):
+                continue
+            span = _span(error)
+            if span is not None:
+                spanned.append((span, sample, error))
+            else:
+                unspanned.setdefault(normalize_error_pattern(error.get("error_text", "")), []).append((None, sample, error))
+
+    groups: List[List[Tuple[Optional[Tuple[int, int]], int, dict]]] = []
+    group_end = -1
+    for member in sorted(spanned, key=lambda entry: entry[0]):
+        (start, end), _, _ = member
+        if groups and start < group_end:
+            groups[-1].append(member)
+            group_end = max(group_end, end)
+        else:
+            groups.append([member])
+            group_end = end
+    groups += [members for text, members in unspanned.items() if text]
+
+    merged = []
+    for members in groups:
+        support = len({sample for _, sample, _ in members})
+        if support < min_support:
+            continue
+        spans = [span for span, _, _ in members]
+        if spans[0] is None:
+            best = members[0][2]
+        else:
+            overlaps = [sum(min(end, other_end) > max(start, other_start) for other_start, other_end in spans)
+                        for start, end in spans]
+            best = members[int(np.argmax(overlaps))][2]
+        merged.append({**best, 'support': support})
+    return sorted(merged, key=lambda error: _span(error) or (float('inf'), 0))
+
+
+def combine_evaluations(evaluations: Sequence[dict], criteria: Sequence[str] = CRITERIA,
+                        min_support: Optional[int] = None,
+                        grid: Sequence[float] = BAND_SCORES) -> Tuple[dict, Dict[str, Any]]:
+    """One evaluation from several samples, plus the per-criterion spread and sample scores.
+
+    Each criterion keeps the reasoning and strengths of the sample whose score
+    is closest to the median. ``min_support`` defaults to a majority of the samples.
+    """
+    matrix = score_matrix(evaluations, criteria)
+    aggregated = aggregate_scores(matrix, grid)
+    if min_support is None:
+        min_support = len(evaluations) // 2 + 1
+    by_sample = [{normalize_criterion(item.get("Name", "")): item for item in evaluation.get("results", [])
+                  if isinstance(item, dict)} for evaluation in evaluations]
+
+    results, spread, scores = [], {}, {}
+    for column, criterion in enumerate(criteria):
+        if not aggregated['samples'][column]:
+            continue
+        median = float(aggregated['median'][column])
+        distance = np.abs(np.nan_to_num(matrix[:, column], nan=np.inf) - median)
+        representative = by_sample[int(np.argmin(distance))][normalize_criterion(criterion)]
+        errors = merge_errors([sample.get(normalize_criterion(criterion), {}).get("Errors") or []
+                               for sample in by_sample], min(min_support, int(aggregated['samples'][column])))
+        results.append({**representative, "Name": criterion, "Score": median, "Errors": errors})
+        spread[criterion] = float(aggregated['spread'][column])
+        scores[criterion] = snap_scores(matrix[~np.isnan(matrix[:, column]), column], grid).tolist()
+    return {"results": results}, {'samples': len(evaluations), 'spread': spread, 'scores': scores}
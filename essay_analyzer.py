@@ -1,31 +1,260 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_community.callbacks.manager import get_openai_callback
+import asyncio
 import json
-from typing import List, Dict, Tuple, Any
-import numpy as np
+import logging
+import random
+import time
+from contextlib import contextmanager
+import queue
+import threading
+from functools import partial
+from typing import (TYPE_CHECKING, List, Dict, Tuple, Any, Awaitable, Iterable, Optional, Callable, AsyncIterator,
+                    Iterator)
 import re
 from dotenv import load_dotenv
 import os
+from json_stream import IncrementalResultsParser, repair_json
+from metrics import (ANALYSES, ANALYSIS_SECONDS, COALESCED_REQUESTS, CRITERIA_REASKED, JSON_REPAIRS, PARSE_FAILURES,
+                     SUGGESTION_CACHE, VERIFIER_DECISIONS, VERIFIER_REASONS, AnalysisTrace, current_trace, record_stage)
+from result_cache import ResultCache, hash_text, make_cache_key
+from rate_limiter import RateLimitScheduler, estimate_tokens, is_rate_limit_error, retry_after_seconds, shared_scheduler
+from single_flight import SingleFlight
+from schemas import (CriterionEvaluation, EssayEvaluation, FusedEssayEvaluation, RevisionEvaluation, VerifiedEssayEvaluation,
+                     response_format, validate)
+from pydantic import ValidationError
+
+# Heavy dependencies (langchain_openai, the OpenAI SDK, httpx, NumPy) are imported where first
+# needed, so importing this module stays cheap for the UI, the batch grader and the service.
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from transport import HTTPPool
 
 load_dotenv()
 
+# Routine per-request decisions go here rather than to stdout; failures are still printed.
+logger = logging.getLogger(__name__)
+
 api_key = os.getenv("OPENAI_API_KEY")
 
+CRITERIA = ["Task Response", "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+CRITERION_GUIDELINES = {
+    "Task Response": """Evaluate the relevance, completeness, and development of ideas in response to the topic. Focus on:
+    •	Strengths: Highlight well-developed arguments, relevant examples, and clear focus on all parts of the task.
+    •	Errors: Identify issues such as irrelevant information, underdeveloped arguments, unsupported claims, or failure to address all parts of the question.""",
+    "Coherence and Cohesion": """Assess the logical flow of ideas, use of cohesive devices, and paragraphing. Focus on:
+    •	Strengths: Highlight logical progression of ideas, effective paragraph structure, and appropriate use of cohesive devices.
+    •	Errors: Identify issues like unclear organization, overuse/misuse of linking words, poor paragraphing, or abrupt transitions.""",
+    "Lexical Resource": """Evaluate vocabulary range, precision, and appropriateness for the task. Focus on:
+    •	Strengths: Highlight use of a wide range of precise vocabulary, effective paraphrasing, and appropriate collocations.
+    •	Errors: Identify repetition, inappropriate word choices, spelling mistakes, or limited vocabulary.""",
+    "Grammatical Range and Accuracy": """Evaluate the variety and accuracy of sentence structures, grammar, and punctuation. Focus on:
+    •	Strengths: Highlight accurate use of complex structures, diverse sentence types, and correct punctuation.
+    •	Errors: Identify grammar mistakes (e.g., tense, subject-verb agreement), sentence structure issues, or punctuation errors.""",
+}
+VERIFIER_POLICIES = ("always", "auto", "never")
+# fast: one call returns scores, errors and suggestions; standard: evaluator plus parallel
+# suggestion calls; thorough: standard plus the verifier (run according to verifier_policy).
+PROFILES = ("fast", "standard", "thorough")
+EVALUATION_MODES = ("single", "sharded")
+OUTPUT_MODES = ("json", "structured")
+# Expected completion tokens per stage, added to the prompt estimate when reserving rate-limit capacity.
+EXPECTED_COMPLETION_TOKENS = {"evaluator": 1500, "verifier": 1500, "suggestions": 700, "criterion": 500, "reask": 500,
+                              "revision": 800}
+
+# sanitize_input drops markup/JSON punctuation and anything outside printable ASCII except newlines.
+_DISALLOWED_CHARS = re.compile(r'[<>{}\[\];]|[^\x20-\x7E\n]')
+_EDGE_PUNCTUATION = " .,;:!?'\"()-"
+_ALLOWED_RUN = re.compile(r'[^<>{}\[\];\x00-\x09\x0B-\x1F\x7F-\U0010FFFF]+')
+
+
+def normalize_criterion(name: str) -> str:
+    """Canonical form of a criterion name ('Grammatical Range & Accuracy' == 'grammatical range and accuracy')."""
+    return " ".join(str(name).replace("&", "and").lower().split())
+
+
+def normalize_error_pattern(text: str) -> str:
+    """Case, whitespace and edge punctuation insensitive form of an error text or description."""
+    return " ".join(str(text).lower().split()).strip(_EDGE_PUNCTUATION)
+
+
+def openai_chat_model(model: str, temperature: float, http_pool: Optional["HTTPPool"] = None,
+                      **kwargs: Any) -> "BaseChatModel":
+    """Default chat_model_factory: an OpenAI chat model on ``http_pool`` (the process-wide shared pool by default)."""
+    from langchain_openai import ChatOpenAI
+    from transport import shared_pool
+
+    pool = http_pool or shared_pool()
+    options = {'openai_api_key': api_key, **pool.chat_model_options(), **kwargs}
+    return ChatOpenAI(model=model, temperature=temperature, **options)
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop the synchronous API runs on, started on first use.
+
+    A long-lived loop keeps its HTTP connection pool (see transport.py) warm between calls.
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ielts-analyzer-loop", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+def _run_sync(coro: Awaitable, calls: Optional["queue.Queue"] = None) -> Any:
+    """Run a coroutine to completion from synchronous code, on the shared background loop.
+
+    Callables the coroutine puts on ``calls`` are run in the calling thread while it
+    waits, so callbacks (e.g. Streamlit updates) keep the caller's thread context.
+    """
+    loop = _get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("cannot block the analyzer's background loop; await the coroutine instead")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        if calls is None:
+            return future.result()
+        future.add_done_callback(lambda _: calls.put(None))
+        while True:
+            call = calls.get()
+            if call is None:
+                break
+            call()
+        return future.result()
+    except BaseException:
+        # The caller gave up (a callback raised, or it was interrupted): stop the analysis
+        # instead of leaving it running on the shared loop.
+        future.cancel()
+        raise
+
+
 class IELTSEssayAnalyzer:
     def __init__(self, 
                  max_essay_length: int = 3000,
                  temperature: float = 0.4,
                  suggestion_temperature: float = 0.7,
                  verifier_temperature: float = 0.1,
-                 model: str = "gpt-4o-mini"):
+                 model: str = "gpt-4o-mini",
+                 max_suggestion_concurrency: int = 4,
+                 cache: Optional[ResultCache] = None,
+                 chat_model_factory: Callable[..., "BaseChatModel"] = openai_chat_model,
+                 verifier_policy: str = "auto",
+                 verifier_sample_rate: float = 0.0,
+                 verifier_extreme_scores: Tuple[float, float] = (4.0, 8.5),
+                 offset_tolerance: int = 20,
+                 output_mode: str = "json",
+                 reask_missing_criteria: bool = True,
+                 profile: str = "thorough",
+                 evaluation_mode: str = "single",
+                 suggestion_cache: Optional[ResultCache] = None,
+                 pre_analysis_in_prompt: bool = False,
+                 coalesce_requests: bool = True,
+                 http_pool: Optional["HTTPPool"] = None,
+                 warm_up_connections: int = 0,
+                 rate_limiter: Optional[RateLimitScheduler] = None,
+                 rate_limit_retries: int = 3,
+                 ensemble_samples: int = 1,
+                 revision_max_change: float = 0.5):
+        if profile not in PROFILES:
+            raise ValueError(f"profile must be one of {PROFILES}, got {profile!r}")
+        if evaluation_mode not in EVALUATION_MODES:
+            raise ValueError(f"evaluation_mode must be one of {EVALUATION_MODES}, got {evaluation_mode!r}")
+        if evaluation_mode == "sharded" and profile == "fast":
+            raise ValueError("the fast profile evaluates in a single fused call and cannot be sharded")
+        if ensemble_samples < 1:
+            raise ValueError(f"ensemble_samples must be at least 1, got {ensemble_samples}")
+        if ensemble_samples > 1 and evaluation_mode == "sharded":
+            raise ValueError("ensembles sample the single evaluator call and cannot be combined with sharding")
+        if verifier_policy not in VERIFIER_POLICIES:
+            raise ValueError(f"verifier_policy must be one of {VERIFIER_POLICIES}, got {verifier_policy!r}")
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"output_mode must be one of {OUTPUT_MODES}, got {output_mode!r}")
         self.max_essay_length = max_essay_length
-        self.llm = ChatOpenAI(openai_api_key=api_key, model=model, temperature=temperature)
-        self.suggestions_llm = ChatOpenAI(openai_api_key=api_key, model=model, 
-                                    temperature=suggestion_temperature)
-        self.verifier_llm = ChatOpenAI(openai_api_key=api_key, model=model, temperature=verifier_temperature)
+        self.profile = profile
+        # "sharded" replaces the single evaluator call with one concurrent call per criterion
+        # (criterion_prompt), so evaluator latency is that of the slowest criterion.
+        self.evaluation_mode = evaluation_mode
+        # With more than one sample the evaluator is asked for that many completions in one request
+        # (the API's n); ensemble.combine_evaluations reduces them to median scores and merged errors.
+        self.ensemble_samples = ensemble_samples
+        # analyze_revision re-evaluates only the edited passages of a resubmitted essay, unless more
+        # than this share of the text changed, in which case the full pipeline runs again.
+        self.revision_max_change = revision_max_change
+        self.model = model
+        self.temperature = temperature
+        self.suggestion_temperature = suggestion_temperature
+        self.verifier_temperature = verifier_temperature
+        self.cache = cache
+        # Suggestions are cached per error (criterion + normalized error text and description),
+        # so recurring mistakes across students skip the suggestions call.
+        self.suggestion_cache = suggestion_cache
+        # Adds the locally computed statistics (pre_analysis.format_for_prompt) to the evaluator
+        # prompts so the model does not have to estimate word counts or repetition itself.
+        self.pre_analysis_in_prompt = pre_analysis_in_prompt
+        # Identical analyses (same _cache_key) that overlap in time share one pipeline run,
+        # even when they come from different threads or event loops.
+        self.coalesce_requests = coalesce_requests
+        self._in_flight = SingleFlight()
+        # With "auto" the verifier only runs when the local checks in _verifier_reasons find a problem,
+        # a score is at or beyond verifier_extreme_scores, or the essay is picked by verifier_sample_rate.
+        self.verifier_policy = verifier_policy
+        self.verifier_sample_rate = verifier_sample_rate
+        self.verifier_extreme_scores = verifier_extreme_scores
+        self.offset_tolerance = offset_tolerance
+        # "structured" asks the provider for JSON-schema constrained output (schemas.EssayEvaluation)
+        # and uses the compact structured_prompt, which needs no formatting spec or example.
+        self.output_mode = output_mode
+        # Criteria lost to malformed or truncated evaluator output are re-requested one by one
+        # with criterion_prompt instead of failing the whole analysis.
+        self.reask_missing_criteria = reask_missing_criteria
+        self.max_suggestion_concurrency = max(1, max_suggestion_concurrency)
+        self.chat_model_factory = chat_model_factory
+        # Every LLM call reserves capacity from the rate limiter (shared by all analyzers using the
+        # OpenAI models) and calls failing with 429 are retried up to rate_limit_retries times.
+        if rate_limiter is None and chat_model_factory is openai_chat_model:
+            rate_limiter = shared_scheduler()
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = max(0, rate_limit_retries)
+        # The three OpenAI models share one keep-alive pool; it is also shared with every other
+        # analyzer in the process unless a dedicated http_pool is given. With a rate limiter the
+        # pool leaves 429s to it instead of retrying them inside the OpenAI client.
+        if http_pool is None and chat_model_factory is openai_chat_model:
+            from transport import shared_pool
+            http_pool = shared_pool(retry_rate_limits=rate_limiter is None)
+        elif http_pool is not None and rate_limiter is not None and http_pool.retry_rate_limits:
+            print("http_pool retries 429s itself; pass HTTPPool(retry_rate_limits=False) to leave them to the rate limiter")
+        self.http_pool = http_pool
+        pool_option = {'http_pool': http_pool} if http_pool is not None else {}
+        self.llm = chat_model_factory(model=model, temperature=temperature, **pool_option)
+        self.suggestions_llm = chat_model_factory(model=model, temperature=suggestion_temperature, **pool_option)
+        self.verifier_llm = chat_model_factory(model=model, temperature=verifier_temperature, **pool_option)
+        if warm_up_connections:
+            self.warm_up(warm_up_connections)
         
-        self.valid_scores = np.arange(0, 9.5, 0.5).tolist()
+        self.valid_scores = [step / 2 for step in range(19)]
+
+        # Request options of the evaluator call, also passed to the multi-sample ensemble request.
+        self._evaluator_options = ({'response_format': response_format(self._evaluation_schema())}
+                                   if output_mode == "structured" else {})
+        if output_mode == "structured":
+            self.evaluator_model = self.llm.bind(**self._evaluator_options)
+            self.verifier_model = self.verifier_llm.bind(response_format=response_format(VerifiedEssayEvaluation))
+            self.criterion_model = self.llm.bind(response_format=response_format(CriterionEvaluation))
+            self.revision_model = self.llm.bind(response_format=response_format(RevisionEvaluation))
+        else:
+            self.evaluator_model = self.llm
+            self.verifier_model = self.verifier_llm
+            self.criterion_model = self.llm
+            self.revision_model = self.llm
         
 
         self.prompt = '''You are an AI IELTS essay evaluator. Your task is to analyze the essay provided below based on four IELTS scoring criteria: **Task Response**, **Coherence and Cohesion**, **Lexical Resource**, and **Grammatical Range and Accuracy**. 
@@ -126,6 +355,76 @@ class IELTSEssayAnalyzer:
     Topic:
     {topic}'''
 
+        self.structured_prompt = '''Evaluate the IELTS Task 2 essay below on the four IELTS criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range and Accuracy.
+
+        For each criterion give a band score (0 to 9 in 0.5 steps) with reasoning against the band descriptors, list the strengths, and list every error with its exact text, its start and end character positions in the essay, a description, and why it is an error.
+
+        - Task Response: relevance, completeness and development of ideas; every part of the question addressed; irrelevant, underdeveloped or unsupported points.
+        - Coherence and Cohesion: logical progression, paragraphing, use and overuse/misuse of cohesive devices, abrupt transitions.
+        - Lexical Resource: range, precision and appropriacy of vocabulary, paraphrasing, collocations; repetition, wrong word choice, spelling.
+        - Grammatical Range and Accuracy: variety and accuracy of sentence structures; tense, agreement, sentence structure and punctuation errors.
+
+    Essay:
+    {essay}
+    Topic:
+    {topic}'''
+
+        fused_instructions = '''Evaluate the IELTS Task 2 essay below on the four IELTS criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range and Accuracy, and give the student feedback in the same answer.
+
+        For each criterion give a band score (0 to 9 in 0.5 steps) with reasoning against the band descriptors, list the strengths, and list every error with its exact text, its start and end character positions in the essay, a description, and why it is an error. Then, for that criterion, suggest a fix with a corrected example for each error, and give general advice and practice exercises.
+
+        - Task Response: relevance, completeness and development of ideas; every part of the question addressed; irrelevant, underdeveloped or unsupported points.
+        - Coherence and Cohesion: logical progression, paragraphing, use and overuse/misuse of cohesive devices, abrupt transitions.
+        - Lexical Resource: range, precision and appropriacy of vocabulary, paraphrasing, collocations; repetition, wrong word choice, spelling.
+        - Grammatical Range and Accuracy: variety and accuracy of sentence structures; tense, agreement, sentence structure and punctuation errors.
+'''
+        essay_block = '''
+    Essay:
+    {essay}
+    Topic:
+    {topic}'''
+        self.fused_structured_prompt = fused_instructions + essay_block
+        self.fused_prompt = fused_instructions + '''
+        You MUST respond ONLY with valid JSON of this form:
+        {{"results": [{{"Name": "<Criterion Name>", "Score": <numerical score>, "Reasoning for Score": "<string>", "Strengths": ["<string>"],
+          "Errors": [{{"start": <int>, "end": <int>, "error_text": "<string>", "description": "<string>", "Reasoning for Error Identification": "<string>"}}],
+          "Suggestions": [{{"error_text": "<string>", "suggestion": "<string>", "example": "<string>"}}],
+          "General Advice": ["<string>"], "Recommended Exercises": ["<string>"]}}]}}
+''' + essay_block
+
+        self.criterion_prompt = '''You are an AI IELTS essay evaluator. Evaluate the essay below ONLY on the criterion **{criterion}**.
+
+        {guidelines}
+
+        Provide a band score (in 0.5 increments), the strengths, and every error with its start and end character positions, the exact error_text, a description, and the reasoning behind identifying it.
+
+        You MUST respond ONLY with one JSON object of this form:
+        {{"Name": "{criterion}", "Score": <numerical score>, "Reasoning for Score": "<string>", "Strengths": ["<list of strengths>"], "Errors": [{{"start": <int>, "end": <int>, "error_text": "<string>", "description": "<string>", "Reasoning for Error Identification": "<string>"}}]}}
+
+    Essay:
+    {essay}
+    Topic:
+    {topic}'''
+
+        self.revision_prompt = '''You are an AI IELTS essay evaluator re-assessing a revised essay. It was evaluated before; only the passages below have changed since.
+
+    Topic:
+    {topic}
+    The revised essay has {word_count} words in {paragraph_count} paragraphs.
+
+    Previous band scores of the whole essay:
+    {previous_scores}
+
+    Changed passages (Before is the old text; in After only the text between >>> and <<< is new, the rest is context):
+    {passages}
+
+        For each of the four criteria (**Task Response**, **Coherence and Cohesion**, **Lexical Resource**, **Grammatical Range and Accuracy**):
+        1. Give the band score (in 0.5 increments) of the whole revised essay, starting from the previous score and adjusting it only for the effect of these changes.
+        2. List every error in the new text (between >>> and <<<) only, quoting its error_text exactly as it appears there.
+
+        You MUST respond ONLY with one JSON object of this form:
+        {{"results": [{{"Name": "<criterion>", "Score": <numerical score>, "Reasoning for Score": "<string>", "Errors": [{{"error_text": "<string>", "description": "<string>", "Reasoning for Error Identification": "<string>"}}]}}]}}'''
+
         self.suggestions_prompt = """Based on the following errors found in an IELTS essay for the criterion '{criterion}':
                        {errors}
                        Provide specific suggestions for improvement. 
@@ -142,46 +441,7 @@ class IELTSEssayAnalyzer:
                          "recommended_exercises": [<list of specific practice exercises>]
                        }}"""
 
-    def _validate_score(self, score: float) -> float:
-        if not isinstance(score, (int, float)):
-            return 0.0
-        if score < 0:
-            return 0.0
-        if score > 9.0:
-            return 9.0
-        closest_score = min(self.valid_scores, key=lambda x: abs(x - score))
-        return closest_score
-
-    def _generate_suggestions(self, errors: List[Dict], criterion: str) -> Dict:
-        if not errors:
-            return {
-                "suggestions": [],
-                "general_advice": ["Continue practicing to maintain current level"],
-                "recommended_exercises": ["Regular writing practice"]
-            }
-
-        formatted_errors = "\n".join(
-            f"- {error['error_text']}: {error['description']}"
-            for error in errors
-        )
-        try:
-            result = self.suggestions_llm([SystemMessage(content='You are a professional IELTS errors checker'), HumanMessage(content=self.suggestions_prompt.format(errors=formatted_errors, criterion=criterion))])
-            suggestions_data = json.loads(result.content)
-            return {
-                    "suggestions": suggestions_data.get('suggestions', []),
-                    "general_advice": suggestions_data.get('general_advice', []),
-                    "recommended_exercises": suggestions_data.get('recommended_exercises', [])
-                }
-        except Exception as e:
-            print(f"Error generating suggestions: {e}")
-            return {
-                "suggestions": [],
-                "general_advice": ["Error generating specific suggestions"],
-                "recommended_exercises": []
-            }
-    
-    def _create_verifier_prompt(self, evaluator_json: dict, essay: str, topic: str) -> str:
-        verifier_prompt_template = """You are an AI assistant tasked with verifying the output of an IELTS essay evaluation. You will receive a JSON object containing the evaluation of an essay across four criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range & Accuracy.
+        self.verifier_prompt_template = """You are an AI assistant tasked with verifying the output of an IELTS essay evaluation. You will receive a JSON object containing the evaluation of an essay across four criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range & Accuracy.
 
         Your task is to meticulously check the evaluation for the following:
         0. Check if the essay text and topic match the provided input. If they do not match, flag this as an error and assign score for Task Response 0.0.
@@ -237,35 +497,483 @@ class IELTSEssayAnalyzer:
         {essay}
         """
 
-        evaluator_json_str = json.dump(evaluator_json, indent=4)
-        return verifier_prompt_template.format(evaluator_json_str=evaluator_json_str, essay=essay, topic=topic)
+    def warm_up(self, connections: int = 2, base_url: Optional[str] = None) -> int:
+        """Open keep-alive connections to the API ahead of the first analysis; returns how many were opened."""
+        if self.http_pool is None:
+            return 0
+        from transport import DEFAULT_BASE_URL
+        return _run_sync(self.http_pool.awarm_up(base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL,
+                                                 connections))
+
+    @contextmanager
+    def _meter(self, stage: str, criterion: Optional[str] = None) -> Iterator[Any]:
+        """Time one LLM call and record its token usage and cost (see metrics.record_stage)."""
+        from langchain_community.callbacks.manager import get_openai_callback
+
+        started = time.perf_counter()
+        ok = False
+        with get_openai_callback() as cb:
+            try:
+                yield cb
+                ok = True
+            finally:
+                record_stage(stage, time.perf_counter() - started,
+                             prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens,
+                             cost=cb.total_cost, criterion=criterion, ok=ok)
+
+    async def _acquire_capacity(self, stage: str, messages: List, samples: int = 1) -> int:
+        """Wait for rate-limit capacity for one call; returns its token estimate."""
+        if self.rate_limiter is None:
+            return 0
+        estimate = estimate_tokens((str(message.content) for message in messages),
+                                   EXPECTED_COMPLETION_TOKENS.get(stage, 600) * samples)
+        await self.rate_limiter.acquire(estimate)
+        return estimate
+
+    def _release_capacity(self, estimate: int, usage: Any, error: Optional[BaseException], stage: str,
+                          attempt: int) -> bool:
+        """Settle the token estimate of a finished call; returns whether a rate-limited call should be retried."""
+        if self.rate_limiter is None:
+            return False
+        self.rate_limiter.settle(estimate, getattr(usage, 'total_tokens', 0))
+        if error is None:
+            self.rate_limiter.report_success()
+            return False
+        if not is_rate_limit_error(error):
+            return False
+        delay = self.rate_limiter.report_rate_limited(retry_after_seconds(error), stage=stage)
+        print(f"Rate limited during {stage}, pausing LLM calls for {delay:.1f}s")
+        return attempt < self.rate_limit_retries
+
+    async def _ainvoke(self, model: Any, messages: List, stage: str, criterion: Optional[str] = None) -> Any:
+        """One metered LLM call through the rate limiter."""
+        return await self._acall(partial(model.ainvoke, messages), messages, stage, criterion=criterion)
+
+    async def _asample(self, messages: List, stage: str, samples: int) -> List[str]:
+        """``samples`` evaluator completions of one prompt, drawn in a single request."""
+        result = await self._acall(partial(self.llm.agenerate, [messages], n=samples, **self._evaluator_options),
+                                   messages, stage, samples=samples)
+        return [generation.message.content for generation in result.generations[0]]
+
+    async def _acall(self, call: Callable[[], Awaitable[Any]], messages: List, stage: str,
+                     criterion: Optional[str] = None, samples: int = 1) -> Any:
+        for attempt in range(self.rate_limit_retries + 1):
+            estimate = await self._acquire_capacity(stage, messages, samples)
+            usage = None
+            try:
+                with self._meter(stage, criterion=criterion) as usage:
+                    result = await call()
+            except Exception as e:
+                if not self._release_capacity(estimate, usage, e, stage, attempt):
+                    raise
+            else:
+                self._release_capacity(estimate, usage, None, stage, attempt)
+                return result
+
+    async def _astream(self, model: Any, messages: List, stage: str) -> AsyncIterator[Any]:
+        """Stream one metered LLM call through the rate limiter; only a call that produced nothing yet is retried."""
+        for attempt in range(self.rate_limit_retries + 1):
+            estimate = await self._acquire_capacity(stage, messages)
+            usage = None
+            received = False
+            try:
+                with self._meter(stage) as usage:
+                    async for chunk in model.astream(messages):
+                        received = True
+                        yield chunk
+            except Exception as e:
+                if not self._release_capacity(estimate, usage, e, stage, attempt) or received:
+                    raise
+            else:
+                self._release_capacity(estimate, usage, None, stage, attempt)
+                return
+
+    def _validate_score(self, score: Any) -> float:
+        return self._validate_scores([score])[0]
+
+    def _validate_scores(self, scores: Iterable[Any]) -> List[float]:
+        """Snap scores to the nearest of valid_scores, ties going down; out-of-range and non-numbers are clipped or 0.0."""
+        from ensemble import snap_scores
+
+        return snap_scores(list(scores), self.valid_scores).tolist()
 
-    def _parse_json(self, generated_text: str) -> dict:
-        generated_text = generated_text.strip()
+    async def _agenerate_suggestions(self, errors: List[Dict], criterion: str) -> Dict:
+        if not errors:
+            return {
+                "suggestions": [],
+                "general_advice": ["Continue practicing to maintain current level"],
+                "recommended_exercises": ["Regular writing practice"]
+            }
+
+        cached: Dict[int, Dict] = {}
+        if self.suggestion_cache is not None:
+            for index, error in enumerate(errors):
+                hit = self.suggestion_cache.get(self._suggestion_key(criterion, error))
+                SUGGESTION_CACHE.inc(result='hit' if hit is not None else 'miss')
+                if hit is not None:
+                    cached[index] = {**hit, 'error_text': error['error_text']}
+            if len(cached) == len(errors):
+                advice = self.suggestion_cache.get(self._advice_key(criterion)) or {}
+                return {
+                    "suggestions": [cached[index] for index in range(len(errors))],
+                    "general_advice": advice.get('general_advice', []),
+                    "recommended_exercises": advice.get('recommended_exercises', [])
+                }
+        uncached = [error for index, error in enumerate(errors) if index not in cached]
+
+        formatted_errors = "\n".join(
+            f"- {error['error_text']}: {error['description']}"
+            for error in uncached
+        )
         try:
-            return json.loads(generated_text)
-        except json.JSONDecodeError as e:
-            print(f"JSON Decode Error: {e}")
-            generated_text = generated_text.replace("```json", "").replace("```", "")
+            result = await self._ainvoke(self.suggestions_llm, [SystemMessage(content='You are a professional IELTS errors checker'), HumanMessage(content=self.suggestions_prompt.format(errors=formatted_errors, criterion=criterion))],
+                                         'suggestions', criterion=criterion)
+            suggestions_data = self._parse_json(result.content, 'suggestions')
+            if suggestions_data is None:
+                raise ValueError("suggestions output is not JSON")
+            generated = {
+                    "suggestions": suggestions_data.get('suggestions', []),
+                    "general_advice": suggestions_data.get('general_advice', []),
+                    "recommended_exercises": suggestions_data.get('recommended_exercises', [])
+                }
+        except Exception as e:
+            print(f"Error generating suggestions for {criterion}: {e}")
+            generated = {
+                "suggestions": [],
+                "general_advice": ["Error generating specific suggestions"],
+                "recommended_exercises": []
+            }
+            return {**generated, "suggestions": list(cached.values())}
+
+        if self.suggestion_cache is None:
+            return generated
+        return self._merge_suggestions(criterion, errors, cached, generated)
+
+    def _suggestion_key(self, criterion: str, error: Dict) -> str:
+        return make_cache_key(
+            'suggestion', normalize_criterion(criterion),
+            normalize_error_pattern(error.get('error_text', '')), normalize_error_pattern(error.get('description', '')),
+            self.model, self.suggestion_temperature, hash_text(self.suggestions_prompt),
+        )
+
+    def _advice_key(self, criterion: str) -> str:
+        return make_cache_key('advice', normalize_criterion(criterion), self.model, hash_text(self.suggestions_prompt))
+
+    def _merge_suggestions(self, criterion: str, errors: List[Dict], cached: Dict[int, Dict], generated: Dict) -> Dict:
+        """Store fresh suggestions per error and merge them with the cached ones in error order."""
+        fresh: Dict[str, List[Dict]] = {}
+        for suggestion in generated['suggestions']:
+            if isinstance(suggestion, dict):
+                fresh.setdefault(normalize_error_pattern(suggestion.get('error_text', '')), []).append(suggestion)
+
+        merged = []
+        for index, error in enumerate(errors):
+            if index in cached:
+                merged.append(cached[index])
+                continue
+            matches = fresh.get(normalize_error_pattern(error['error_text']))
+            if matches:
+                suggestion = matches.pop(0)
+                self.suggestion_cache.set(self._suggestion_key(criterion, error), suggestion)
+                merged.append(suggestion)
+        # Suggestions the model did not tie to a listed error are kept but not cached.
+        merged += [suggestion for remaining in fresh.values() for suggestion in remaining]
+        self.suggestion_cache.set(self._advice_key(criterion), {
+            'general_advice': generated['general_advice'],
+            'recommended_exercises': generated['recommended_exercises'],
+        })
+        return {**generated, "suggestions": merged}
+
+    def _create_verifier_prompt(self, evaluator_json: dict, essay: str, topic: str) -> str:
+        evaluator_json_str = json.dumps(evaluator_json, indent=4)
+        return self.verifier_prompt_template.format(evaluator_json_str=evaluator_json_str, essay=essay, topic=topic)
+
+    def _missing_criteria(self, evaluation: dict) -> List[str]:
+        present = {normalize_criterion(item.get("Name", "")) for item in evaluation.get("results", [])
+                   if isinstance(item, dict)}
+        return [criterion for criterion in CRITERIA if normalize_criterion(criterion) not in present]
+
+    async def _aevaluate_criterion(self, criterion: str, essay_text: str, topic: str,
+                                   stage: str = 'reask') -> Optional[dict]:
+        """Evaluate a single criterion with a small focused prompt."""
+        prompt = self._with_pre_analysis(
+            self.criterion_prompt.format(criterion=criterion, guidelines=CRITERION_GUIDELINES[criterion],
+                                         essay=essay_text, topic=topic), essay_text)
+        result = await self._ainvoke(self.criterion_model, [SystemMessage(content="You are an AI IELTS essay evaluator."),
+                                                            HumanMessage(content=prompt)], stage, criterion=criterion)
+        item = self._parse_evaluation(result.content, stage, CriterionEvaluation)
+        if not item or "Score" not in item:
+            return None
+        return {**item, "Name": criterion}
+
+    async def _acomplete_missing_criteria(self, evaluation: dict, essay_text: str, topic: str) -> Tuple[dict, List[str]]:
+        """Re-request only the criteria missing from ``evaluation``; returns the completed evaluation and their names."""
+        missing = self._missing_criteria(evaluation)
+        if not missing or not self.reask_missing_criteria:
+            return evaluation, []
+        print(f"Re-requesting missing criteria: {', '.join(missing)}")
+        items = await asyncio.gather(*(self._aevaluate_criterion(criterion, essay_text, topic) for criterion in missing),
+                                     return_exceptions=True)
+        recovered = []
+        results = list(evaluation.get("results", []))
+        for criterion, item in zip(missing, items):
+            if isinstance(item, BaseException) or item is None:
+                print(f"Re-request for {criterion} failed: {item}")
+                CRITERIA_REASKED.inc(outcome='failed')
+                continue
+            CRITERIA_REASKED.inc(outcome='recovered')
+            results.append(item)
+            recovered.append(criterion)
+        return {**evaluation, "results": results}, recovered
+
+    async def _asharded_evaluation(self, essay_text: str, topic: str,
+                                   on_criterion: Optional[Callable[[Dict[str, Any]], None]],
+                                   semaphore: asyncio.Semaphore,
+                                   early: Dict[str, Tuple[List, "asyncio.Task"]]) -> dict:
+        """Evaluate the four criteria with concurrent focused calls and merge them into one evaluation.
+
+        With ``on_criterion`` each criterion is reported, and its suggestions started,
+        as soon as its own call finishes. Failed shards are simply left out; the
+        caller re-requests missing criteria.
+        """
+        async def evaluate(criterion: str) -> Optional[dict]:
+            item = await self._aevaluate_criterion(criterion, essay_text, topic, stage='evaluator')
+            if item is not None and on_criterion is not None:
+                self._report_provisional(item, on_criterion, semaphore, early)
+            return item
+
+        items = await asyncio.gather(*(evaluate(criterion) for criterion in CRITERIA), return_exceptions=True)
+        results = []
+        for criterion, item in zip(CRITERIA, items):
+            if isinstance(item, BaseException):
+                print(f"Evaluation of {criterion} failed: {item}")
+            elif item is not None:
+                results.append(item)
+        return {"results": results}
+
+    @staticmethod
+    def _find_conflicts(evaluation: dict) -> List[Dict[str, Any]]:
+        """Disagreements between independently evaluated criteria.
+
+        'shared_error': the same stretch of text is flagged under more than one
+        criterion; 'score_spread': criterion scores are three or more bands apart.
+        """
+        flagged = []
+        for item in evaluation.get("results", []):
+            errors = item.get("Errors")
+            for error in errors if isinstance(errors, list) else []:
+                if not isinstance(error, dict):
+                    continue
+                start, end = error.get("start"), error.get("end")
+                if isinstance(start, int) and isinstance(end, int) and end > start:
+                    flagged.append((start, end, item.get("Name"), error.get("error_text")))
+        flagged.sort(key=lambda entry: entry[0])
+
+        conflicts = []
+        for i, (start, end, name, text) in enumerate(flagged):
+            for other_start, other_end, other_name, other_text in flagged[i + 1:]:
+                if other_start >= end:
+                    break
+                if other_name != name:
+                    conflicts.append({'type': 'shared_error', 'criteria': [name, other_name],
+                                      'start': max(start, other_start), 'end': min(end, other_end),
+                                      'error_text': [text, other_text]})
+
+        scores = {item.get("Name"): item.get("Score") for item in evaluation.get("results", [])
+                  if isinstance(item.get("Score"), (int, float)) and not isinstance(item.get("Score"), bool)}
+        if scores:
+            lowest, highest = min(scores, key=scores.get), max(scores, key=scores.get)
+            if scores[highest] - scores[lowest] >= 3:
+                conflicts.append({'type': 'score_spread', 'criteria': [lowest, highest],
+                                  'scores': [scores[lowest], scores[highest]]})
+        return conflicts
+
+    def _check_evaluation(self, evaluation: dict, essay: str) -> List[str]:
+        """Local consistency checks on evaluator output; returns one 'check: detail' string per problem."""
+        problems = []
+        results = evaluation.get("results")
+        if not isinstance(results, list):
+            return ["missing_field: results"]
+
+        seen = set()
+        for item in results:
+            if not isinstance(item, dict):
+                problems.append("missing_field: criterion entry is not an object")
+                continue
+            name = item.get("Name")
+            for field in ("Name", "Score", "Reasoning for Score", "Strengths", "Errors"):
+                if field not in item:
+                    problems.append(f"missing_field: {field} in {name or 'unnamed criterion'}")
+            if name is not None:
+                seen.add(normalize_criterion(name))
+
+            score = item.get("Score")
+            if "Score" in item and (isinstance(score, bool) or not isinstance(score, (int, float))
+                                    or self._validate_score(score) != score):
+                problems.append(f"invalid_score: {name} scored {score!r}")
+
+            errors = item.get("Errors", [])
+            if not isinstance(errors, list):
+                problems.append(f"missing_field: Errors of {name} is not a list")
+                continue
+            for error in errors:
+                missing = [field for field in ("start", "end", "error_text", "description")
+                           if not isinstance(error, dict) or field not in error]
+                if missing:
+                    problems.append(f"missing_field: {', '.join(missing)} in an error of {name}")
+                    continue
+                if not self._error_located(error, essay):
+                    problems.append(f"offset_mismatch: {error['error_text']!r} not found near "
+                                    f"{error['start']}-{error['end']} ({name})")
+
+        for criterion in CRITERIA:
+            if normalize_criterion(criterion) not in seen:
+                problems.append(f"missing_criterion: {criterion}")
+        return problems
+
+    def _error_located(self, error: dict, essay: str) -> bool:
+        """Whether error_text occurs in the essay within offset_tolerance characters of its reported start."""
+        error_text, start = error.get("error_text"), error.get("start")
+        if not isinstance(error_text, str) or not error_text or not isinstance(start, int):
+            return False
+        window_start = max(0, start - self.offset_tolerance)
+        window_end = start + self.offset_tolerance + len(error_text)
+        return essay.find(error_text, window_start, window_end) != -1
+
+    def _verifier_reasons(self, evaluation: dict, essay: str) -> List[str]:
+        """Why the verifier should run for this evaluation; an empty list means it can be skipped."""
+        if self.verifier_policy == "never":
+            return []
+        if self.verifier_policy == "always":
+            return ["policy: always"]
+
+        reasons = self._check_evaluation(evaluation, essay)
+        low, high = self.verifier_extreme_scores
+        for item in evaluation.get("results", []):
+            score = item.get("Score") if isinstance(item, dict) else None
+            if isinstance(score, (int, float)) and not isinstance(score, bool) and (score <= low or score >= high):
+                reasons.append(f"extreme_score: {item.get('Name')} scored {score}")
+        if not reasons and self.verifier_sample_rate and random.random() < self.verifier_sample_rate:
+            reasons.append("sampled: random audit")
+        return reasons
+
+    def _evaluator_prompt(self) -> str:
+        if self.profile == "fast":
+            return self.fused_structured_prompt if self.output_mode == "structured" else self.fused_prompt
+        return self.structured_prompt if self.output_mode == "structured" else self.prompt
+
+    def _evaluation_schema(self):
+        return FusedEssayEvaluation if self.profile == "fast" else EssayEvaluation
+
+    def _evaluator_messages(self, essay_text: str, topic: str) -> List:
+        return [SystemMessage(content="You are an AI IELTS essay evaluator. Your task is to analyze the essay provided below based on four IELTS scoring criteria: **Task Response**, **Coherence and Cohesion**, **Lexical Resource**, and **Grammatical Range and Accuracy**."), 
+                HumanMessage(content=self._with_pre_analysis(self._evaluator_prompt().format(essay=essay_text, topic=topic),
+                                                             essay_text))]
+
+    def _with_pre_analysis(self, prompt: str, essay_text: str) -> str:
+        if not self.pre_analysis_in_prompt:
+            return prompt
+        from pre_analysis import essay_statistics, format_for_prompt
+
+        return (f"{prompt}\n\n    Measured locally (exact, use instead of estimating): "
+                f"{format_for_prompt(essay_statistics(essay_text))}")
+
+    def _parse_evaluation(self, generated_text: str, stage: str, schema=EssayEvaluation) -> Optional[dict]:
+        """Parse evaluator/verifier output; in structured mode it is also validated against ``schema``."""
+        parsed = self._parse_json(generated_text, stage)
+        if parsed and self.output_mode == "structured":
             try:
-                return json.loads(generated_text)
-            except:
-                print("JSON could not be fixed: {generated_text}")
-                return None
+                parsed = validate(schema, parsed)
+            except ValidationError as e:
+                # Keep the loosely parsed JSON; the local checks decide whether it needs verifying.
+                print(f"{stage} output does not match {schema.__name__}: {e}")
+        if not parsed:
+            PARSE_FAILURES.inc(stage=stage)
+        return parsed
+
+    def _parse_json(self, generated_text: str, stage: str = "output") -> dict:
+        parsed, method = repair_json(generated_text)
+        if parsed is None:
+            print(f"{stage} JSON could not be recovered: {generated_text[:200]!r}")
+        elif method != 'strict':
+            recovered = len(parsed.get("results", [])) if isinstance(parsed.get("results"), list) else 0
+            print(f"Recovered {stage} JSON ({method}), {recovered} criteria")
+            JSON_REPAIRS.inc(stage=stage, method=method)
+        return parsed
     
+    @staticmethod
+    def _error_signature(errors: List[Dict]) -> List[Tuple[Any, Any]]:
+        """The parts of a criterion's errors that its suggestions depend on."""
+        return [(error.get('error_text'), error.get('description')) for error in errors]
+
+    async def _agenerate_all_suggestions(self, criteria: List[Tuple[str, List[Dict]]],
+                                         semaphore: Optional[asyncio.Semaphore] = None,
+                                         early: Optional[Dict[str, Tuple[List, "asyncio.Task"]]] = None) -> List[Dict]:
+        """Generate suggestions for every criterion concurrently, at most max_suggestion_concurrency at a time.
+
+        ``early`` maps criterion names to suggestion tasks already started while the
+        evaluator was streaming; a task is reused when the final errors for that
+        criterion still match the ones it was started with.
+        """
+        semaphore = semaphore or asyncio.Semaphore(self.max_suggestion_concurrency)
+        early = early or {}
+
+        async def generate(name: str, errors: List[Dict]) -> Dict:
+            pending = early.get(name)
+            if pending is not None and pending[0] == self._error_signature(errors):
+                return await pending[1]
+            async with semaphore:
+                return await self._agenerate_suggestions(errors, name)
+
+        outcomes = await asyncio.gather(*(generate(name, errors) for name, errors in criteria),
+                                        return_exceptions=True)
+        suggestions = []
+        for (name, _), outcome in zip(criteria, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"Error generating suggestions for {name}: {outcome}")
+                outcome = {
+                    "suggestions": [],
+                    "general_advice": ["Error generating specific suggestions"],
+                    "recommended_exercises": []
+                }
+            suggestions.append(outcome)
+        return suggestions
+
     def _process_results(self, parsed_result: dict) -> List[Dict[str, Any]]:
+        return _run_sync(self._aprocess_results(parsed_result))
+
+    def _collect_errors(self, item: dict) -> List[Dict]:
+        errors = []
+        for error in item.get('Errors', []):
+            try:
+                error_text = error.get('error_text', "")
+                errors.append({**error, 'error_text': error_text})
+            except (KeyError, IndexError) as e:
+                print(f"Error processing error entry: {e}")
+                continue
+        return errors
+
+    async def _aprocess_results(self, parsed_result: dict,
+                                semaphore: Optional[asyncio.Semaphore] = None,
+                                early: Optional[Dict[str, Tuple[List, "asyncio.Task"]]] = None) -> List[Dict[str, Any]]:
+        items = [(item, self._collect_errors(item)) for item in parsed_result.get("results", [])]
+
+        # Criteria from the fused "fast" call already carry their suggestions.
+        generated = iter(await self._agenerate_all_suggestions(
+            [(item['Name'], errors) for item, errors in items if "Suggestions" not in item],
+            semaphore=semaphore, early=early))
+
+        scores = self._validate_scores(item.get('Score', 0) for item, _ in items)
         results = []
-        for item in parsed_result.get("results", []):
-            errors = []
-            for error in item.get('Errors', []):
-                try:
-                    error_text = error.get('error_text', "")
-                    errors.append({**error, 'error_text': error_text})
-                except (KeyError, IndexError) as e:
-                    print(f"Error processing error entry: {e}")
-                    continue
-            suggestions_data = self._generate_suggestions(errors, item['Name'])
-            validated_score = self._validate_score(float(item.get('Score',0)))
+        for (item, errors), validated_score in zip(items, scores):
+            if "Suggestions" in item:
+                suggestions_data = {
+                    'suggestions': item.get('Suggestions') or [],
+                    'general_advice': item.get('General Advice') or [],
+                    'recommended_exercises': item.get('Recommended Exercises') or [],
+                }
+            else:
+                suggestions_data = next(generated)
             strength = item.get('Strengths', [])
             results.append({
                 'Name': item['Name'],
@@ -287,44 +995,494 @@ class IELTSEssayAnalyzer:
         
     def sanitize_input(self, text: str) -> str:
         """Sanitize user input to prevent injections or harmful content."""
-        text = re.sub(r'[<>{}\[\];]', '', text)
-        text = re.sub(r'[^\x20-\x7E\n]', '', text) 
-        return text[:3000]
+        return _DISALLOWED_CHARS.sub('', text)[:self.max_essay_length]
 
-    def analyze_essay(self, essay_text: str, topic: str) -> Tuple[List[Dict], List[Dict]]:
-        print("Analyzing essay...")
+    def pre_analyze(self, text: str) -> Dict[str, Any]:
+        """Instant statistics of the sanitized essay (see pre_analysis.batch_statistics); no LLM call."""
+        from pre_analysis import essay_statistics
+
+        return essay_statistics(self.sanitize_input(text))
+
+    def sanitize_with_offsets(self, text: str) -> Tuple[str, List[int]]:
+        """sanitize_input plus a map from sanitized to original character offsets.
+
+        ``offset_map[i]`` is the index in ``text`` of sanitized character ``i``; the
+        extra final entry is the original offset just past the last kept character,
+        so a sanitized span ``[start, end)`` maps to ``[offset_map[start], offset_map[end - 1] + 1)``.
+        """
+        pieces, offset_map = [], []
+        remaining = self.max_essay_length
+        for run in _ALLOWED_RUN.finditer(text):
+            if remaining <= 0:
+                break
+            piece = run.group()[:remaining]
+            pieces.append(piece)
+            offset_map.extend(range(run.start(), run.start() + len(piece)))
+            remaining -= len(piece)
+        offset_map.append(offset_map[-1] + 1 if offset_map else 0)
+        return "".join(pieces), offset_map
+
+    def _cache_key(self, essay_text: str, topic: str) -> str:
+        """Key covering everything that influences the result for an already sanitized essay."""
+        return make_cache_key(
+            essay_text, topic, self.model,
+            self.temperature, self.suggestion_temperature, self.verifier_temperature,
+            hash_text(self._evaluator_prompt()), hash_text(self.suggestions_prompt), hash_text(self.verifier_prompt_template),
+            self.profile, self.evaluation_mode, self.ensemble_samples, self.output_mode, self.pre_analysis_in_prompt, self.reask_missing_criteria, hash_text(self.criterion_prompt),
+            self.verifier_policy, self.verifier_sample_rate, list(self.verifier_extreme_scores), self.offset_tolerance,
+        )
+
+    async def _aanalyze(self, essay_text: str, topic: str,
+                        on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Analyze one essay and attach its per-stage timings, tokens and cost under 'metrics'. Raises on failure."""
+        return await self._atraced(lambda: self._acached_analyze(essay_text, topic, on_criterion))
+
+    async def _atraced(self, analysis: Callable[[], Awaitable[Tuple[Dict[str, Any], str]]]) -> Dict[str, Any]:
+        """Run ``analysis`` (returning the report and its source) under a fresh AnalysisTrace and attach 'metrics'."""
+        trace = AnalysisTrace()
+        token = current_trace.set(trace)
+        outcome = 'error'
+        try:
+            report, source = await analysis()
+            outcome = 'ok' if source == 'computed' else source
+        finally:
+            current_trace.reset(token)
+            metrics = trace.summary()
+            ANALYSES.inc(status=outcome)
+            ANALYSIS_SECONDS.observe(metrics['wall_time'], status=outcome)
+        return {**report, 'metrics': {**metrics, 'cached': source == 'cached', 'coalesced': source == 'coalesced'}}
 
+    async def _acached_analyze(self, essay_text: str, topic: str,
+                               on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[Dict[str, Any], str]:
+        """Run the evaluator -> verifier -> suggestions chain, going through the cache if one is set.
+
+        Returns the report and where it came from: 'computed', 'cached', or 'coalesced'
+        (shared from an identical analysis that was already running).
+        """
         essay_text = self.sanitize_input(essay_text)
+        if self.cache is None and not self.coalesce_requests:
+            return await self._arun_pipeline(essay_text, topic, on_criterion), 'computed'
+
+        key = self._cache_key(essay_text, topic)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._replay_scores(cached, on_criterion)
+                return cached, 'cached'
 
+        async def compute() -> Dict[str, Any]:
+            report = await self._arun_pipeline(essay_text, topic, on_criterion)
+            if self.cache is not None and report['scores']:
+                self.cache.set(key, report)
+            return report
+
+        if not self.coalesce_requests:
+            return await compute(), 'computed'
+        report, shared = await self._in_flight.run(key, compute)
+        if not shared:
+            return report, 'computed'
+        COALESCED_REQUESTS.inc()
+        self._replay_scores(report, on_criterion)
+        return report, 'coalesced'
+
+    @staticmethod
+    def _replay_scores(report: Dict[str, Any], on_criterion: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        if on_criterion is not None:
+            for score in report['scores']:
+                on_criterion({**score, 'Provisional': False})
+
+    def _report_provisional(self, item: dict, on_criterion: Callable[[Dict[str, Any]], None],
+                            semaphore: asyncio.Semaphore,
+                            early: Dict[str, Tuple[List, "asyncio.Task"]]) -> None:
+        """Pass a freshly generated criterion to ``on_criterion`` and start its suggestions early."""
+        errors = self._collect_errors(item)
+        if "Suggestions" not in item:
+            early[item['Name']] = (self._error_signature(errors),
+                                   asyncio.create_task(self._asuggest_limited(errors, item['Name'], semaphore)))
+        on_criterion({
+            'Name': item['Name'],
+            'Score': self._validate_score(item.get('Score', 0)),
+            'Errors': errors,
+            'Strengths': item.get('Strengths', []),
+            'Provisional': True,
+        })
+
+    async def _asuggest_limited(self, errors: List[Dict], name: str, semaphore: asyncio.Semaphore) -> Dict:
+        async with semaphore:
+            return await self._agenerate_suggestions(errors, name)
+
+    async def _aensemble_evaluation(self, messages: List) -> Tuple[Optional[dict], Optional[Dict[str, Any]]]:
+        """Draw ensemble_samples evaluations in one request and combine the parseable ones."""
+        from ensemble import combine_evaluations
+
+        texts = await self._asample(messages, 'evaluator', self.ensemble_samples)
+        evaluations = [evaluation for evaluation in
+                       (self._parse_evaluation(text, 'evaluator', self._evaluation_schema()) for text in texts)
+                       if evaluation]
+        if not evaluations:
+            return None, None
+        if len(evaluations) < len(texts):
+            print(f"{len(texts) - len(evaluations)} of {len(texts)} evaluator samples could not be parsed")
+        return combine_evaluations(evaluations, grid=self.valid_scores)
+
+    async def _astream_evaluator(self, messages: List, on_criterion: Callable[[Dict[str, Any]], None],
+                                 semaphore: asyncio.Semaphore,
+                                 early: Dict[str, Tuple[List, "asyncio.Task"]]) -> Optional[dict]:
+        """Stream the evaluator, reporting each criterion and starting its suggestions as soon as it is complete."""
+        parser = IncrementalResultsParser()
+        streamed = []
+
+        async for chunk in self._astream(self.evaluator_model, messages, 'evaluator'):
+            for item in parser.feed(chunk.content):
+                if 'Name' not in item:
+                    continue
+                streamed.append(item)
+                self._report_provisional(item, on_criterion, semaphore, early)
+
+        evaluator_json = self._parse_evaluation(parser.text, 'evaluator', self._evaluation_schema())
+        if not evaluator_json and streamed:
+            evaluator_json = {"results": streamed}
+        return evaluator_json
+
+    async def _arun_pipeline(self, essay_text: str, topic: str,
+                             on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        semaphore = asyncio.Semaphore(self.max_suggestion_concurrency)
+        early: Dict[str, Tuple[List, asyncio.Task]] = {}
         try:
-            with get_openai_callback() as cb:
-                evaluator_result = self.llm.invoke([SystemMessage(content="You are an AI IELTS essay evaluator. Your task is to analyze the essay provided below based on four IELTS scoring criteria: **Task Response**, **Coherence and Cohesion**, **Lexical Resource**, and **Grammatical Range and Accuracy**."), 
-                                                    HumanMessage(content=self.prompt.format(essay=essay_text, topic=topic))])
-                #print(f"Evaluator OpenAI Callback: {cb}")
+            evaluator_messages = self._evaluator_messages(essay_text, topic)
+            ensemble = None
+            if self.evaluation_mode == "sharded":
+                evaluator_json = await self._asharded_evaluation(essay_text, topic, on_criterion, semaphore, early)
+            elif self.ensemble_samples > 1:
+                # Samples arrive together, so there is nothing to stream; criteria are reported once combined.
+                evaluator_json, ensemble = await self._aensemble_evaluation(evaluator_messages)
+                if on_criterion is not None and evaluator_json:
+                    for item in evaluator_json["results"]:
+                        self._report_provisional(item, on_criterion, semaphore, early)
+            elif on_criterion is not None:
+                evaluator_json = await self._astream_evaluator(evaluator_messages, on_criterion, semaphore, early)
+            else:
+                evaluator_result = await self._ainvoke(self.evaluator_model, evaluator_messages, 'evaluator')
+                evaluator_json = self._parse_evaluation(evaluator_result.content, 'evaluator', self._evaluation_schema())
+
+            if not evaluator_json and not self.reask_missing_criteria:
+                raise ValueError("Evaluator output could not be parsed as JSON")
+            evaluator_json, reasked = await self._acomplete_missing_criteria(evaluator_json or {"results": []},
+                                                                             essay_text, topic)
+            if not evaluator_json["results"]:
+                raise ValueError("Evaluator output could not be parsed as JSON")
+            if on_criterion is not None:
+                for item in evaluator_json["results"]:
+                    if item.get("Name") in reasked:
+                        self._report_provisional(item, on_criterion, semaphore, early)
+
+            conflicts = self._find_conflicts(evaluator_json) if self.evaluation_mode == "sharded" else []
+            for conflict in conflicts:
+                print(f"Conflict between {' and '.join(map(str, conflict['criteria']))}: {conflict['type']}")
+
+            final_json = evaluator_json
+            verifier_reasons = self._verifier_reasons(evaluator_json, essay_text) if self.profile == "thorough" else []
+            if self.profile == "thorough" and self.verifier_policy == "auto":
+                # Criteria evaluated apart may disagree about the same text; let the verifier reconcile them.
+                verifier_reasons += [f"conflict: {conflict['type']} between {' and '.join(map(str, conflict['criteria']))}"
+                                     for conflict in conflicts]
+            for reason in verifier_reasons:
+                VERIFIER_REASONS.inc(check=reason.split(":", 1)[0])
+            # Only the thorough profile has a verifier pass to skip; the others never run the checks.
+            if self.profile == "thorough":
+                VERIFIER_DECISIONS.inc(decision='invoked' if verifier_reasons else 'skipped')
+
+            if not verifier_reasons:
+                if self.profile == "thorough":
+                    logger.debug("Evaluator output passed local checks, skipping verifier")
+            else:
+                logger.debug("Running verifier: %s", "; ".join(verifier_reasons))
+                verifier_prompt = self._create_verifier_prompt(evaluator_json, essay_text, topic)
 
-            evaluator_json = self._parse_json(evaluator_result.content)
-            if not evaluator_json:
-                return [], []
+                verifier_result = await self._ainvoke(self.verifier_model, [SystemMessage(content="You are an AI assistant tasked with verifying the output of an IELTS essay evaluation. You will receive a JSON object containing the evaluation of an essay across four criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range & Accuracy."), 
+                                                                            HumanMessage(content=verifier_prompt)], 'verifier')
 
-            verifier_prompt = self._create_verifier_prompt(evaluator_json, essay_text, topic)
+                verifier_json = self._parse_evaluation(verifier_result.content, 'verifier', VerifiedEssayEvaluation)
 
-            with get_openai_callback() as cb:
-                verifier_result = self.verifier_llm.invoke([SystemMessage(content="You are an AI assistant tasked with verifying the output of an IELTS essay evaluation. You will receive a JSON object containing the evaluation of an essay across four criteria: Task Response, Coherence and Cohesion, Lexical Resource, and Grammatical Range & Accuracy."), 
-                                                          HumanMessage(content=verifier_prompt)])
-                #print(f"Verifier OpenAI Callback: {cb}")
+                if not verifier_json:
+                    print("Verifier JSON could not be parsed, using evaluator results")
+                else:
+                    verifier_comments = verifier_json.pop("Verifier's Comments", "")
+                    logger.debug("Verifier comments:\n%s", verifier_comments)
+                    # Criteria lost from a damaged verifier response keep the evaluator's version.
+                    kept = {normalize_criterion(item.get("Name", "")) for item in verifier_json.get("results", [])}
+                    verifier_json["results"] = list(verifier_json.get("results", [])) + [
+                        item for item in evaluator_json["results"]
+                        if normalize_criterion(item.get("Name", "")) not in kept]
+                    final_json = verifier_json
 
-            verifier_json = self._parse_json(verifier_result.content)
+            return {
+                'scores': await self._aprocess_results(final_json, semaphore=semaphore, early=early),
+                'errors': self._process_errors(final_json),
+                'verifier': {'invoked': bool(verifier_reasons), 'reasons': verifier_reasons},
+                'reasked_criteria': reasked,
+                'profile': self.profile,
+                'conflicts': conflicts,
+                'pre_analysis': self.pre_analyze(essay_text),
+                'ensemble': ensemble,
+                'essay': essay_text,
+                'topic': topic,
+                'revision': None,
+            }
+        finally:
+            # Early suggestions the verifier made obsolete are no longer needed.
+            for _, task in early.values():
+                task.cancel()
+
+    def _revision_messages(self, previous: Dict[str, Any], essay_text: str, topic: str, changed: List) -> List:
+        from pre_analysis import essay_statistics
+        from revision import format_passages
+
+        statistics = essay_statistics(essay_text)
+        previous_scores = "\n    ".join(f"- {item['Name']}: {item['Score']}" for item in previous['scores'])
+        prompt = self.revision_prompt.format(
+            topic=topic, word_count=statistics['word_count'], paragraph_count=statistics['paragraph_count'],
+            previous_scores=previous_scores, passages=format_passages(previous['essay'], essay_text, changed))
+        return [SystemMessage(content="You are an AI IELTS essay evaluator. Your task is to update the evaluation of a revised essay based on four IELTS scoring criteria: **Task Response**, **Coherence and Cohesion**, **Lexical Resource**, and **Grammatical Range and Accuracy**."),
+                HumanMessage(content=prompt)]
 
-            if not verifier_json:
-                print("Verifier JSON could not be parsed, using evaluator results")
-                return self._process_results(evaluator_json), self._process_errors(evaluator_json)
-            
-            verifier_comments = verifier_json.pop("Verifier's Comments", "")
-            print(f"Verifier comments:\n{verifier_comments}")
+    async def _arevise(self, previous: Dict[str, Any], essay_text: str, topic: str,
+                       on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[Dict[str, Any], str]:
+        """Re-evaluate the edited passages of ``essay_text`` against ``previous``; falls back to a full analysis.
+
+        Returns the report and its source: 'revised', 'unchanged', or that of the full analysis.
+        """
+        from revision import carry_over_errors, changed_fraction, diff_essays, locate_in_region
+
+        essay_text = self.sanitize_input(essay_text)
+        old = previous.get('essay')
 
-            return self._process_results(verifier_json), self._process_errors(verifier_json)
+        def full(reason: str) -> Awaitable[Tuple[Dict[str, Any], str]]:
+            print(f"Running a full analysis: {reason}")
+            return self._acached_analyze(essay_text, topic, on_criterion)
 
+        if not isinstance(old, str) or not previous.get('scores'):
+            return await full("the previous report has no essay or scores")
+        if previous.get('topic', topic) != topic or previous.get('profile', self.profile) != self.profile:
+            return await full("the topic or profile changed")
+        unchanged, changed = diff_essays(old, essay_text)
+        if not changed:
+            # Same wording, at most the whitespace around paragraphs moved: shift the errors, no LLM call.
+            carried = [(item, *carry_over_errors(item.get('Errors', []), old, unchanged)) for item in previous['scores']]
+            results = [{**item, 'Errors': kept} for item, kept, _ in carried]
+            self._replay_scores({'scores': results}, on_criterion)
+            return {
+                'scores': results,
+                'errors': self._process_errors({'results': results}),
+                'verifier': {'invoked': False, 'reasons': []},
+                'reasked_criteria': [],
+                'profile': self.profile,
+                'conflicts': [],
+                'pre_analysis': self.pre_analyze(essay_text),
+                'ensemble': None,
+                'essay': essay_text,
+                'topic': topic,
+                'revision': {'mode': 'unchanged', 'changed_regions': 0, 'changed_fraction': 0.0,
+                             'kept_errors': sum(len(kept) for _, kept, _ in carried),
+                             'dropped_errors': sum(dropped for _, _, dropped in carried)},
+            }, 'unchanged'
+
+        fraction = changed_fraction(old, essay_text, changed)
+        if fraction > self.revision_max_change:
+            report, source = await full(f"{fraction:.0%} of the essay changed")
+            return {**report, 'revision': {'mode': 'full', 'changed_regions': len(changed), 'changed_fraction': fraction,
+                                           'kept_errors': 0, 'dropped_errors': len(previous.get('errors', []))}}, source
+
+        result = await self._ainvoke(self.revision_model, self._revision_messages(previous, essay_text, topic, changed),
+                                     'revision')
+        revised = self._parse_evaluation(result.content, 'revision', RevisionEvaluation)
+        updates = {normalize_criterion(item.get('Name', '')): item for item in (revised or {}).get('results', [])
+                   if isinstance(item, dict)}
+        if not updates:
+            return await full("the revision output could not be parsed")
+
+        kept_total = dropped_total = unlocated = 0
+        criteria = []
+        for item in previous['scores']:
+            kept, dropped = carry_over_errors(item.get('Errors', []), old, unchanged)
+            kept_total += len(kept)
+            dropped_total += dropped
+            update = updates.get(normalize_criterion(item['Name']), {})
+            added = []
+            for error in update.get('Errors') or []:
+                error_text = error.get('error_text', '') if isinstance(error, dict) else ''
+                span = next(filter(None, (locate_in_region(error_text, essay_text, region) for region in changed)), None)
+                if span is None:
+                    unlocated += 1
+                    continue
+                added.append({**error, 'error_text': essay_text[span[0]:span[1]], 'start': span[0], 'end': span[1]})
+            criteria.append((item, update, kept, added))
+        if unlocated:
+            print(f"Dropped {unlocated} revision errors not found in the changed passages")
+
+        semaphore = asyncio.Semaphore(self.max_suggestion_concurrency)
+        generated = await asyncio.gather(*(self._asuggest_limited(added, item['Name'], semaphore)
+                                           for item, _, _, added in criteria if added))
+        generated = iter(generated)
+        scores = self._validate_scores(update.get('Score', item['Score']) for item, update, _, _ in criteria)
+        results = []
+        for (item, update, kept, added), score in zip(criteria, scores):
+            kept_texts = {normalize_error_pattern(error.get('error_text', '')) for error in kept}
+            suggestions = [suggestion for suggestion in item.get('Suggestions', [])
+                           if isinstance(suggestion, dict)
+                           and normalize_error_pattern(suggestion.get('error_text', '')) in kept_texts]
+            advice = {'general_advice': item.get('GeneralAdvice', []),
+                      'recommended_exercises': item.get('Exercises', [])}
+            if added:
+                fresh = next(generated)
+                suggestions += fresh['suggestions']
+                advice = fresh
+            results.append({
+                'Name': item['Name'],
+                'Score': score,
+                'Errors': sorted(kept + added, key=lambda error: error.get('start', 0)),
+                'Strengths': item.get('Strengths', []),
+                'Suggestions': suggestions,
+                'GeneralAdvice': advice['general_advice'],
+                'Exercises': advice['recommended_exercises'],
+            })
+        self._replay_scores({'scores': results}, on_criterion)
+
+        return {
+            'scores': results,
+            'errors': self._process_errors({'results': results}),
+            'verifier': {'invoked': False, 'reasons': []},
+            'reasked_criteria': [],
+            'profile': self.profile,
+            'conflicts': [],
+            'pre_analysis': self.pre_analyze(essay_text),
+            'ensemble': None,
+            'essay': essay_text,
+            'topic': topic,
+            'revision': {'mode': 'incremental', 'changed_regions': len(changed), 'changed_fraction': fraction,
+                         'kept_errors': kept_total, 'dropped_errors': dropped_total},
+        }, 'revised'
+
+    async def analyze_revision_async(self, previous: Dict[str, Any], essay_text: str, topic: str,
+                                     on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Analyze an edited essay, reusing ``previous`` (a report of an earlier version) for the unchanged text.
+
+        Errors and suggestions in unchanged text are kept with their offsets moved to
+        the new text. The edited passages, with a sentence of context, go to one
+        revision call that returns updated scores and the errors in the new text, and
+        suggestions are generated for those errors only, so the cost follows the size
+        of the edit. The verifier does not run. A full analysis is made instead when
+        more than revision_max_change of the text changed, the topic or profile
+        differs, or the revision output cannot be parsed.
+
+        The report is as analyze_report_async's; 'revision' holds 'mode'
+        ('incremental', 'unchanged' when only whitespace between paragraphs differs,
+        which needs no LLM call, or 'full'), 'changed_regions', 'changed_fraction',
+        'kept_errors' and 'dropped_errors' (previous errors in edited text).
+        ``on_criterion`` receives the final criteria once the revision is done.
+        """
+        return await self._atraced(lambda: self._arevise(previous, essay_text, topic, on_criterion))
+
+    def analyze_revision(self, previous: Dict[str, Any], essay_text: str, topic: str) -> Dict[str, Any]:
+        return _run_sync(self.analyze_revision_async(previous, essay_text, topic))
+
+    async def analyze_report_async(self, essay_text: str, topic: str,
+                                   on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Like analyze_essay_async, but returns the whole report dict and raises instead of returning empty results.
+
+        Besides 'scores' and 'errors' the report has 'metrics': wall time, prompt and
+        completion tokens and cost for the whole analysis and for each LLM call, and
+        'reasked_criteria': criteria the evaluator output lacked that were re-requested
+        individually, 'profile': the pipeline profile that produced it, and 'conflicts':
+        disagreements between criteria found when merging a sharded evaluation,
+        'pre_analysis': the local statistics of the essay, and 'ensemble': with
+        ensemble_samples > 1, the number of samples combined, each criterion's sample
+        scores and their spread (0.0 when all samples agree), else None. 'essay' and
+        'topic' are the sanitized text and topic that were analysed, which is what
+        analyze_revision_async needs of a previous report; 'revision' is None except
+        for reports made by analyze_revision_async.
+        """
+        return await self._aanalyze(essay_text, topic, on_criterion)
+
+    def analyze_report(self, essay_text: str, topic: str) -> Dict[str, Any]:
+        return _run_sync(self.analyze_report_async(essay_text, topic))
+
+    async def analyze_essay_async(self, essay_text: str, topic: str,
+                                  on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                  previous: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """Analyze one essay.
+
+        If ``on_criterion`` is given the evaluator is streamed and the callback receives
+        each criterion (Name, Score, Errors, Strengths, Provisional=True) as soon as it
+        has been generated, before verification and suggestions finish. With
+        ``previous``, the report of an earlier version of the essay, only the edited
+        passages are re-evaluated (see analyze_revision_async).
+        """
+        print("Analyzing essay...")
+        try:
+            if previous is not None:
+                report = await self.analyze_revision_async(previous, essay_text, topic, on_criterion)
+            else:
+                report = await self.analyze_report_async(essay_text, topic, on_criterion)
         except Exception as e:
             print(f"An error occurred: {e}")
             return [], []
+        return report['scores'], report['errors']
+
+    async def astream_essay(self, essay_text: str, topic: str) -> AsyncIterator[Dict[str, Any]]:
+        """Async iterator over ``{'event': 'criterion', 'criterion': ...}`` events followed by one
+        ``{'event': 'result', 'scores': ..., 'errors': ...}`` event."""
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run() -> None:
+            scores, errors = await self.analyze_essay_async(
+                essay_text, topic,
+                on_criterion=lambda criterion: queue.put_nowait({'event': 'criterion', 'criterion': criterion}))
+            queue.put_nowait({'event': 'result', 'scores': scores, 'errors': errors})
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event['event'] == 'result':
+                    break
+            await task
+        finally:
+            task.cancel()
+
+    def analyze_essay(self, essay_text: str, topic: str,
+                      on_criterion: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      previous: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict], List[Dict]]:
+        if on_criterion is None:
+            return _run_sync(self.analyze_essay_async(essay_text, topic, previous=previous))
+        # The analysis runs on the background loop; the callback runs here, in the caller's thread.
+        calls: "queue.Queue" = queue.Queue()
+        return _run_sync(self.analyze_essay_async(essay_text, topic, lambda criterion: calls.put(partial(on_criterion, criterion)),
+                                                  previous=previous),
+                         calls)
+
+    async def analyze_batch_async(self, essays: Iterable[Tuple[str, str]],
+                                  max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """Analyze many (essay, topic) pairs on one event loop.
+
+        At most ``max_concurrency`` essays are in flight at once. Results come back in
+        input order as dicts with ``scores``, ``errors`` and ``error`` (None on success,
+        otherwise the failure message for that essay).
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(essay_text: str, topic: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    report = await self.analyze_report_async(essay_text, topic)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    return {'scores': [], 'errors': [], 'error': f"{type(e).__name__}: {e}"}
+            return {**report, 'error': None}
+
+        return list(await asyncio.gather(*(run(essay_text, topic) for essay_text, topic in essays)))
 
+    def analyze_batch(self, essays: Iterable[Tuple[str, str]],
+                      max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        return _run_sync(self.analyze_batch_async(essays, max_concurrency=max_concurrency))
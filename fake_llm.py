@@ -0,0 +1,277 @@
+"""Deterministic, offline stand-in for the OpenAI chat models used by IELTSEssayAnalyzer.
+
+``FakeChatModel`` recognises which pipeline stage a prompt belongs to and answers
+with either a recorded response for that stage or synthetic JSON derived from
+the essay in the prompt, after a configurable delay. It reports token usage the
+same way ChatOpenAI does, so callbacks and metrics behave as they would against
+the real API.
+
+    analyzer = IELTSEssayAnalyzer(chat_model_factory=fake_chat_model_factory(latency=0.5))
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from itertools import cycle
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field, PrivateAttr
+
+CRITERIA = ["Task Response", "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+
+_WORD = re.compile(r"[A-Za-z']{4,}")
+_CRITERION = re.compile(r"ONLY on the criterion \*\*(.+?)\*\*")
+_SUGGESTION_ERROR = re.compile(r"^\s*- (.*?): (.*)$", re.MULTILINE)
+_PREVIOUS_SCORE = re.compile(r"^\s*- (.+?): ([0-9.]+)$", re.MULTILINE)
+_NEW_TEXT = re.compile(r">>>(.*?)<<<", re.DOTALL)
+
+
+def detect_stage(prompt: str) -> str:
+    if "verifying the output of an IELTS essay evaluation" in prompt:
+        return "verifier"
+    if "Provide specific suggestions for improvement" in prompt:
+        return "suggestions"
+    if "re-assessing a revised essay" in prompt:
+        return "revision"
+    if "ONLY on the criterion" in prompt:
+        return "criterion"
+    if "give the student feedback in the same answer" in prompt:
+        return "fused"
+    return "evaluator"
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+
+
+def _extract_essay(prompt: str) -> str:
+    start = prompt.rfind("Essay:")
+    end = prompt.rfind("Topic:")
+    if start == -1 or end <= start:
+        return prompt
+    return prompt[start + len("Essay:"):end].strip()
+
+
+def synthetic_evaluation(essay: str, errors_per_criterion: int = 3, sample: int = 0) -> Dict[str, Any]:
+    """Evaluator-shaped JSON whose error offsets point at real words of ``essay``.
+
+    Further samples (``sample`` > 0, as drawn with ``n``) move scores by up to half
+    a band and may miss one error, like a model sampled at a non-zero temperature.
+    """
+    rng = random.Random(_seed(essay))
+    drift = random.Random(_seed(f"{sample}:{essay}"))
+    words = list(_WORD.finditer(essay))
+    results = []
+    for criterion in CRITERIA:
+        picked = sorted(rng.sample(words, min(errors_per_criterion, len(words))), key=lambda m: m.start())
+        score = rng.choice([5.0, 5.5, 6.0, 6.5, 7.0, 7.5])
+        if sample:
+            score += drift.choice([-0.5, 0.0, 0.0, 0.5])
+            if picked and drift.random() < 0.3:
+                picked.pop(drift.randrange(len(picked)))
+        results.append({
+            "Name": criterion,
+            "Score": score,
+            "Reasoning for Score": f"Synthetic reasoning for {criterion}.",
+            "Strengths": [f"Synthetic strength for {criterion}"],
+            "Errors": [{
+                "start": match.start(),
+                "end": match.end(),
+                "error_text": match.group(),
+                "description": f"Synthetic {criterion.lower()} issue",
+                "Reasoning for Error Identification": "Generated by the offline stand-in.",
+            } for match in picked],
+        })
+    return {"results": results}
+
+
+def synthetic_fused(essay: str, errors_per_criterion: int = 3, sample: int = 0) -> Dict[str, Any]:
+    """Output of the single-call "fast" profile: the synthetic evaluation with suggestions inline."""
+    evaluation = synthetic_evaluation(essay, errors_per_criterion, sample)
+    for item in evaluation["results"]:
+        item["Suggestions"] = [{
+            "error_text": error["error_text"],
+            "suggestion": f"Rewrite '{error['error_text']}' ({error['description']}).",
+            "example": f"A corrected version of '{error['error_text']}'.",
+        } for error in item["Errors"]]
+        item["General Advice"] = ["Review the flagged passages."]
+        item["Recommended Exercises"] = ["Rewrite one paragraph a day."]
+    return evaluation
+
+
+def synthetic_criterion(prompt: str, errors_per_criterion: int = 3) -> Dict[str, Any]:
+    """The evaluator's synthetic result for the single criterion a re-ask prompt names."""
+    match = _CRITERION.search(prompt)
+    name = match.group(1) if match else CRITERIA[0]
+    results = synthetic_evaluation(_extract_essay(prompt), errors_per_criterion)["results"]
+    return next((item for item in results if item["Name"] == name), {**results[0], "Name": name})
+
+
+def synthetic_revision(prompt: str, errors_per_criterion: int = 3) -> Dict[str, Any]:
+    """Revision-shaped JSON: the previous scores unchanged and errors picked from the new text only."""
+    previous = dict(_PREVIOUS_SCORE.findall(prompt))
+    rng = random.Random(_seed(prompt))
+    words = [word for passage in _NEW_TEXT.findall(prompt) for word in _WORD.findall(passage)]
+    per_criterion = min(errors_per_criterion, max(1, len(words) // 8))
+    return {"results": [{
+        "Name": criterion,
+        "Score": float(previous.get(criterion, 6.0)),
+        "Reasoning for Score": f"Synthetic reasoning for the revised {criterion}.",
+        "Errors": [{
+            "error_text": word,
+            "description": f"Synthetic {criterion.lower()} issue",
+            "Reasoning for Error Identification": "Generated by the offline stand-in.",
+        } for word in rng.sample(words, min(per_criterion, len(words)))],
+    } for criterion in CRITERIA]}
+
+
+def synthetic_verification(prompt: str) -> Dict[str, Any]:
+    """Echo the evaluator JSON embedded in a verifier prompt back unchanged."""
+    marker = prompt.find("Here is the JSON you need to verify")
+    start = prompt.find("{", marker if marker != -1 else 0)
+    try:
+        evaluation, _ = json.JSONDecoder().raw_decode(prompt[start:])
+    except (json.JSONDecodeError, ValueError):
+        evaluation = {"results": []}
+    return {**evaluation, "Verifier's Comments": ""}
+
+
+def synthetic_suggestions(prompt: str) -> Dict[str, Any]:
+    return {
+        "suggestions": [{
+            "error_text": error_text,
+            "suggestion": f"Rewrite '{error_text}' ({description}).",
+            "example": f"A corrected version of '{error_text}'.",
+        } for error_text, description in _SUGGESTION_ERROR.findall(prompt)],
+        "general_advice": ["Review the flagged passages."],
+        "recommended_exercises": ["Rewrite one paragraph a day."],
+    }
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model that answers IELTS pipeline prompts.
+
+    ``responses`` maps a stage ("evaluator", "fused", "criterion", "revision", "verifier", "suggestions") to recorded
+    response texts that are replayed in order; stages without recordings get
+    synthetic output. Each call waits ``latency`` seconds plus
+    ``seconds_per_token`` per completion token, and reports ``prompt_tokens`` /
+    ``completion_tokens`` (estimated from text length when unset).
+    """
+
+    model_name: str = "gpt-4o-mini"
+    temperature: float = 0.0
+    latency: float = 0.0
+    seconds_per_token: float = 0.0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    errors_per_criterion: int = 3
+    responses: Dict[str, List[str]] = Field(default_factory=dict)
+    calls: List[Dict[str, Any]] = Field(default_factory=list)
+
+    _replay: Dict[str, Iterator[str]] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-ielts"
+
+    @classmethod
+    def from_recording(cls, path: str, **kwargs: Any) -> "FakeChatModel":
+        with open(path, encoding='utf-8') as f:
+            return cls(responses=json.load(f), **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], sample: int = 0) -> str:
+        prompt = messages[-1].content if messages else ""
+        stage = detect_stage(prompt)
+        if self.responses.get(stage):
+            replay = self._replay.setdefault(stage, cycle(self.responses[stage]))
+            return next(replay)
+        if stage == "verifier":
+            return json.dumps(synthetic_verification(prompt))
+        if stage == "suggestions":
+            return json.dumps(synthetic_suggestions(prompt))
+        if stage == "fused":
+            return json.dumps(synthetic_fused(_extract_essay(prompt), self.errors_per_criterion, sample))
+        if stage == "criterion":
+            return json.dumps(synthetic_criterion(prompt, self.errors_per_criterion))
+        if stage == "revision":
+            return json.dumps(synthetic_revision(prompt, self.errors_per_criterion))
+        return json.dumps(synthetic_evaluation(_extract_essay(prompt), self.errors_per_criterion, sample))
+
+    def _usage(self, messages: List[BaseMessage], texts: List[str]) -> Dict[str, int]:
+        input_tokens = self.prompt_tokens
+        if input_tokens is None:
+            input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = sum(self.completion_tokens if self.completion_tokens is not None else len(text) // 4
+                            for text in texts)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _delay(self, output_tokens: int) -> float:
+        return self.latency + self.seconds_per_token * output_tokens
+
+    def _record(self, messages: List[BaseMessage], started: float, usage: Dict[str, int]) -> None:
+        self.calls.append({
+            "stage": detect_stage(messages[-1].content if messages else ""),
+            "start": started,
+            "end": time.perf_counter(),
+            **usage,
+        })
+
+    def _result(self, texts: List[str], usage: Dict[str, int]) -> ChatResult:
+        # Like the OpenAI API, usage covers all ``n`` completions and is reported once.
+        generations = [ChatGeneration(message=AIMessage(content=text, usage_metadata=usage if index == 0 else None,
+                                                        response_metadata={"model_name": self.model_name}))
+                       for index, text in enumerate(texts)]
+        return ChatResult(generations=generations, llm_output={"model_name": self.model_name})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, n: int = 1, **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        texts = [self._respond(messages, sample) for sample in range(n)]
+        usage = self._usage(messages, texts)
+        time.sleep(self._delay(usage["output_tokens"] // n))
+        self._record(messages, started, usage)
+        return self._result(texts, usage)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, n: int = 1, **kwargs: Any) -> ChatResult:
+        started = time.perf_counter()
+        texts = [self._respond(messages, sample) for sample in range(n)]
+        usage = self._usage(messages, texts)
+        # The n completions are generated in parallel, so latency is that of one.
+        await asyncio.sleep(self._delay(usage["output_tokens"] // n))
+        self._record(messages, started, usage)
+        return self._result(texts, usage)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        text = self._respond(messages)
+        usage = self._usage(messages, [text])
+        await asyncio.sleep(self.latency)
+        # Emit roughly eight tokens (32 characters) per chunk.
+        pieces = [text[i:i + 32] for i in range(0, len(text), 32)] or [""]
+        per_piece = self.seconds_per_token * usage["output_tokens"] / len(pieces)
+        for index, piece in enumerate(pieces):
+            if per_piece:
+                await asyncio.sleep(per_piece)
+            last = index == len(pieces) - 1
+            chunk = AIMessageChunk(content=piece,
+                                   usage_metadata=usage if last else None,
+                                   response_metadata={"model_name": self.model_name} if last else {})
+            if run_manager:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=chunk)
+        self._record(messages, started, usage)
+
+
+def fake_chat_model_factory(**options: Any) -> Callable[..., FakeChatModel]:
+    """A ``chat_model_factory`` for IELTSEssayAnalyzer that builds FakeChatModels sharing ``options``."""
+    def factory(model: str, temperature: float, **kwargs: Any) -> FakeChatModel:
+        return FakeChatModel(model_name=model, temperature=temperature, **{**options, **kwargs})
+    return factory
@@ -0,0 +1,345 @@
+"""HTTP API around IELTSEssayAnalyzer for the LMS and other non-Streamlit clients.
+
+Only the standard library is used. Requests are handled by a threading HTTP
+server; grading happens on ``workers`` coroutines of one background event loop
+fed from a bounded in-memory priority queue. Queued /grade jobs are taken
+before queued /jobs jobs, and ``interactive_reserve`` of the queue's slots are
+kept for /grade, so batch submissions cannot fill it. When the queue is full,
+or a client already has ``per_client_limit`` jobs in flight, requests are shed
+with 429.
+
+    POST /jobs      {"essay": ..., "topic": ...}  -> 202 {"id": ..., "status": "queued"}
+    GET  /jobs/<id>                                -> 200 {"id", "status", "result" | "error"}
+    POST /grade     {"essay": ..., "topic": ...}  -> 200 report (waits for the result)
+    GET  /healthz                                  -> 200 {"status": "ok", ...}
+    GET  /metrics                                  -> Prometheus text format
+
+Clients are told apart by the X-Client-Id header, falling back to their address.
+When OpenAI rate limits are tight, the LLM calls of /grade jobs also go before those of /jobs jobs.
+``--fake-llm`` grades with the offline FakeChatModel, for load tests without network access:
+
+    python grading_service.py --port 8000 --workers 8 --fake-llm --fake-latency 0.5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+from essay_analyzer import PROFILES, IELTSEssayAnalyzer
+from metrics import REGISTRY
+from rate_limiter import PRIORITIES
+from rate_limiter import priority as llm_priority
+
+SERVICE_REQUESTS = REGISTRY.counter("ielts_service_requests_total", "HTTP requests by endpoint and status code.")
+SERVICE_JOBS = REGISTRY.counter("ielts_service_jobs_total", "Finished grading jobs by outcome (ok/error).")
+SERVICE_REJECTED = REGISTRY.counter("ielts_service_rejected_total", "Submissions shed with 429, by reason.")
+SERVICE_QUEUE_DEPTH = REGISTRY.gauge("ielts_service_queue_depth", "Jobs waiting for a worker.")
+SERVICE_RUNNING = REGISTRY.gauge("ielts_service_running_jobs", "Jobs being graded.")
+SERVICE_QUEUE_WAIT = REGISTRY.histogram("ielts_service_queue_wait_seconds", "Time jobs spent queued before grading.")
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class Rejected(Exception):
+    """A submission was shed; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, client: str, essay: str, topic: str, priority: str = "interactive"):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        # Rate-limiter class of the job's LLM calls: POST /grade callers are waiting on the
+        # response, polled POST /jobs submissions are not.
+        self.priority = priority
+        self.essay = essay
+        self.topic = topic
+        self.status = 'queued'
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'id': self.id, 'status': self.status, 'created': self.created}
+        if self.finished is not None:
+            data['finished'] = self.finished
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class GradingService:
+    """Bounded job queue drained by ``workers`` concurrent analyses on a background event loop.
+
+    Jobs are taken interactive first, then in submission order. Batch jobs may
+    fill at most ``queue_size - interactive_reserve`` slots (a quarter of the
+    queue is reserved by default).
+    """
+
+    def __init__(self, analyzer: IELTSEssayAnalyzer, workers: int = 4, queue_size: int = 64,
+                 per_client_limit: int = 4, job_ttl: float = 3600.0, interactive_reserve: Optional[int] = None):
+        self.analyzer = analyzer
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.per_client_limit = max(1, per_client_limit)
+        self.job_ttl = job_ttl
+        if interactive_reserve is None:
+            interactive_reserve = max(1, self.queue_size // 4)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.queue_size - 1)
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._queued = 0
+        self._queued_batch = 0
+        self._sequence = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._thread = threading.Thread(target=self._run_loop, name="grading-workers", daemon=True)
+        self._started = threading.Event()
+
+    def start(self) -> None:
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.PriorityQueue()
+        for _ in range(self.workers):
+            self._loop.create_task(self._worker())
+        self._loop.call_soon(self._started.set)
+        self._loop.run_forever()
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def submit(self, client: str, essay: str, topic: str, priority: str = "interactive") -> Job:
+        """Queue a job, or raise Rejected when the queue or the client's allowance is full."""
+        job = Job(client, essay, topic, priority)
+        with self._lock:
+            self._expire_jobs()
+            batch = job.priority == "batch"
+            if self._queued >= self.queue_size or (
+                    batch and self._queued_batch >= self.queue_size - self.interactive_reserve):
+                SERVICE_REJECTED.inc(reason='queue_full')
+                # A rough hint: the time for every worker to take one more job.
+                raise Rejected('queue full', retry_after=max(1, self._queued // self.workers))
+            if self._in_flight.get(client, 0) >= self.per_client_limit:
+                SERVICE_REJECTED.inc(reason='client_limit')
+                raise Rejected(f'client has {self.per_client_limit} jobs in flight', retry_after=1)
+            self._jobs[job.id] = job
+            self._in_flight[client] = self._in_flight.get(client, 0) + 1
+            self._queued += 1
+            self._queued_batch += batch
+            SERVICE_QUEUE_DEPTH.set(self._queued)
+            entry = (PRIORITIES.index(job.priority), next(self._sequence), job)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, entry)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire_jobs(self) -> None:
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                self._queued_batch -= job.priority == "batch"
+                self._running += 1
+                SERVICE_QUEUE_DEPTH.set(self._queued)
+                SERVICE_RUNNING.set(self._running)
+            SERVICE_QUEUE_WAIT.observe(time.time() - job.created)
+            job.status = 'running'
+            try:
+                with llm_priority(job.priority):
+                    job.result = await self.analyzer.analyze_report_async(job.essay, job.topic)
+                job.status = 'done'
+                SERVICE_JOBS.inc(outcome='ok')
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = 'error'
+                SERVICE_JOBS.inc(outcome='error')
+            finally:
+                job.finished = time.time()
+                with self._lock:
+                    self._running -= 1
+                    self._in_flight[job.client] -= 1
+                    if not self._in_flight[job.client]:
+                        del self._in_flight[job.client]
+                    SERVICE_RUNNING.set(self._running)
+                job.done.set()
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'status': 'ok' if self._thread.is_alive() else 'stopped',
+                'workers': self.workers,
+                'queued': self._queued,
+                'queued_batch': self._queued_batch,
+                'running': self._running,
+                'queue_size': self.queue_size,
+                'interactive_reserve': self.interactive_reserve,
+                'jobs': len(self._jobs),
+            }
+
+
+class GradingRequestHandler(BaseHTTPRequestHandler):
+    service: GradingService = None
+    grade_timeout: float = 300.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _client(self) -> str:
+        return self.headers.get('X-Client-Id') or self.client_address[0]
+
+    def _send(self, status: int, body: Any, endpoint: str, headers: Optional[Dict[str, str]] = None,
+              content_type: str = "application/json") -> None:
+        payload = body.encode('utf-8') if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        SERVICE_REQUESTS.inc(endpoint=endpoint, code=status)
+
+    def _read_submission(self, endpoint: str) -> Optional[Tuple[str, str]]:
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        # The body is left unread on these two errors, so the connection cannot be reused.
+        if length < 0:
+            self._send(400, {'error': 'invalid Content-Length'}, endpoint, headers={'Connection': 'close'})
+            return None
+        if length > MAX_BODY_BYTES:
+            self._send(413, {'error': 'request body too large'}, endpoint, headers={'Connection': 'close'})
+            return None
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send(400, {'error': f'invalid JSON: {e}'}, endpoint)
+            return None
+        if not isinstance(data, dict):
+            data = {}
+        essay, topic = data.get('essay'), data.get('topic')
+        if not isinstance(essay, str) or not isinstance(topic, str) or not essay.strip() or not topic.strip():
+            self._send(400, {'error': 'essay and topic must be non-empty strings'}, endpoint)
+            return None
+        return essay, topic
+
+    def _submit(self, endpoint: str, priority: str) -> Optional[Job]:
+        submission = self._read_submission(endpoint)
+        if submission is None:
+            return None
+        try:
+            return self.service.submit(self._client(), *submission, priority=priority)
+        except Rejected as e:
+            self._send(429, {'error': e.reason}, endpoint, headers={'Retry-After': str(e.retry_after)})
+            return None
+
+    def do_POST(self) -> None:
+        if self.path == '/jobs':
+            job = self._submit('submit', "batch")
+            if job is not None:
+                self._send(202, {'id': job.id, 'status': job.status}, 'submit', headers={'Location': f'/jobs/{job.id}'})
+        elif self.path == '/grade':
+            job = self._submit('grade', "interactive")
+            if job is None:
+                return
+            if not job.done.wait(self.grade_timeout):
+                self._send(504, {'id': job.id, 'status': job.status, 'error': 'grading timed out; poll the job'},
+                           'grade', headers={'Location': f'/jobs/{job.id}'})
+            elif job.status == 'done':
+                self._send(200, {'id': job.id, **job.result}, 'grade')
+            else:
+                self._send(502, job.to_dict(), 'grade')
+        else:
+            self._send(404, {'error': 'not found'}, 'other')
+
+    def do_GET(self) -> None:
+        if self.path.startswith('/jobs/'):
+            job = self.service.get(self.path[len('/jobs/'):])
+            if job is None:
+                self._send(404, {'error': 'unknown job'}, 'poll')
+            else:
+                self._send(200, job.to_dict(), 'poll')
+        elif self.path == '/healthz':
+            health = self.service.health()
+            self._send(200 if health['status'] == 'ok' else 503, health, 'healthz')
+        elif self.path == '/metrics':
+            self._send(200, REGISTRY.to_prometheus(), 'metrics', content_type="text/plain; version=0.0.4")
+        else:
+            self._send(404, {'error': 'not found'}, 'other')
+
+
+def make_server(service: GradingService, host: str = "127.0.0.1", port: int = 8000,
+                grade_timeout: float = 300.0) -> ThreadingHTTPServer:
+    handler = type('BoundGradingRequestHandler', (GradingRequestHandler,),
+                   {'service': service, 'grade_timeout': grade_timeout})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve IELTS essay grading over HTTP.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help="essays graded at once")
+    parser.add_argument('--queue-size', type=int, default=64, help="queued jobs before submissions get 429")
+    parser.add_argument('--interactive-reserve', type=int, default=None,
+                        help="queue slots kept for POST /grade (default: a quarter of the queue)")
+    parser.add_argument('--per-client-limit', type=int, default=4, help="queued or running jobs per client")
+    parser.add_argument('--grade-timeout', type=float, default=300.0, help="seconds POST /grade waits")
+    parser.add_argument('--model', default="gpt-4o-mini")
+    parser.add_argument('--profile', choices=PROFILES, default="thorough")
+    parser.add_argument('--fake-llm', action='store_true', help="grade with the offline FakeChatModel")
+    parser.add_argument('--fake-latency', type=float, default=0.5, help="seconds per fake LLM call")
+    args = parser.parse_args(argv)
+
+    options: Dict[str, Any] = {'model': args.model, 'profile': args.profile}
+    if args.fake_llm:
+        from fake_llm import fake_chat_model_factory
+        options['chat_model_factory'] = fake_chat_model_factory(latency=args.fake_latency)
+    service = GradingService(IELTSEssayAnalyzer(**options), workers=args.workers, queue_size=args.queue_size,
+                             per_client_limit=args.per_client_limit, interactive_reserve=args.interactive_reserve)
+    service.start()
+    server = make_server(service, args.host, args.port, args.grade_timeout)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
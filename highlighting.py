@@ -0,0 +1,154 @@
+from html import escape
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class _PatternMatcher:
+    """Aho-Corasick automaton: finds every occurrence of every pattern in one scan of the text."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = candidate if candidate != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[List[int]]:
+        """Start offsets of each pattern's occurrences, indexed like ``patterns``."""
+        found: List[List[int]] = [[] for _ in self.patterns]
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._out[state]:
+                found[index].append(position - len(self.patterns[index]) + 1)
+        return found
+
+
+def _nearest_in_window(text: str, pattern: str, reported: int, window: int) -> int:
+    """Occurrence of ``pattern`` closest to ``reported`` within ``window`` characters, or -1."""
+    best = -1
+    position = text.find(pattern, max(0, reported - window), reported + window + len(pattern))
+    while position != -1:
+        if best == -1 or abs(position - reported) < abs(best - reported):
+            best = position
+        position = text.find(pattern, position + 1, reported + window + len(pattern))
+    return best
+
+
+def locate_errors(text: str, errors: List[dict],
+                  offset_map: Optional[List[int]] = None,
+                  window: int = 64) -> List[Tuple[int, int, dict]]:
+    """Resolve each error to a ``(start, end, error)`` span of ``text``.
+
+    An error is first looked for within ``window`` characters of the model's
+    reported ``start``; the errors that are not found there are all matched
+    together in one Aho-Corasick pass over the text. Repeated phrases therefore
+    land on the occurrence the model pointed at. If ``offset_map`` (from
+    ``IELTSEssayAnalyzer.sanitize_with_offsets``) is given, matching happens on the
+    sanitized text the model actually saw and the spans are mapped back to ``text``.
+    """
+    if offset_map is not None:
+        searched = "".join(text[i] for i in offset_map[:-1])
+    else:
+        searched = text
+
+    starts: List[int] = []
+    unresolved = []
+    for index, error in enumerate(errors):
+        error_text = error.get('error_text') or ""
+        reported = error.get('start')
+        start = -1
+        if error_text and isinstance(reported, int) and not isinstance(reported, bool):
+            start = _nearest_in_window(searched, error_text, reported, window)
+        starts.append(start)
+        if start == -1 and error_text:
+            unresolved.append(index)
+
+    if unresolved:
+        patterns = sorted({errors[index]['error_text'] for index in unresolved})
+        occurrences = dict(zip(patterns, _PatternMatcher(patterns).find_all(searched)))
+        used_without_offset: Dict[str, int] = {}
+        for index in unresolved:
+            error_text, reported = errors[index]['error_text'], errors[index].get('start')
+            candidates = occurrences[error_text]
+            if not candidates:
+                continue
+            if isinstance(reported, int) and not isinstance(reported, bool):
+                starts[index] = min(candidates, key=lambda candidate: abs(candidate - reported))
+            else:
+                # Without an offset, repeated errors with the same text take successive occurrences.
+                nth = used_without_offset.get(error_text, 0)
+                used_without_offset[error_text] = nth + 1
+                starts[index] = candidates[min(nth, len(candidates) - 1)]
+
+    spans = []
+    for error, start in zip(errors, starts):
+        if start == -1:
+            print(f'Error text "{error.get("error_text")}" not found in the text')
+            continue
+        end = start + len(error['error_text'])
+        if offset_map is not None:
+            start, end = offset_map[start], offset_map[end - 1] + 1
+        spans.append((start, end, error))
+    return spans
+
+
+def _highlight_html(segment: str, active: List[dict]) -> str:
+    descriptions = "<br>".join(escape(str(error.get('description', ''))) for error in active)
+    return (f'<span class="error-highlight">{escape(segment)}<span class="tooltip-text"> '
+            f'<b style=\'align: center;\'>{descriptions}</b> </span></span>')
+
+
+def highlight_text_with_errors(text: str, errors: list[dict],
+                               offset_map: Optional[List[int]] = None) -> str:
+    """Annotate ``text`` with a tooltip span per error in one linear pass.
+
+    Overlapping errors are supported: the text is cut at every span boundary and
+    each piece covered by at least one error is highlighted with the descriptions
+    of all errors covering it.
+    """
+    spans = locate_errors(text, errors, offset_map)
+
+    starts: Dict[int, List[int]] = {}
+    ends: Dict[int, List[int]] = {}
+    for index, (start, end, _) in enumerate(spans):
+        starts.setdefault(start, []).append(index)
+        ends.setdefault(end, []).append(index)
+    boundaries = sorted(set(starts) | set(ends) | {0, len(text)})
+
+    parts = []
+    active: Dict[int, dict] = {}
+    for position, following in zip(boundaries, boundaries[1:]):
+        for index in ends.get(position, ()):
+            active.pop(index, None)
+        for index in starts.get(position, ()):
+            active[index] = spans[index][2]
+        segment = text[position:following]
+        if active:
+            parts.append(_highlight_html(segment, [active[index] for index in sorted(active)]))
+        else:
+            parts.append(escape(segment))
+    return f'<div>{"".join(parts)}</div>'
@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from essay_analyzer import CRITERIA, normalize_criterion
+
+# Column of each criterion in the attempts table.
+CRITERION_COLUMNS = {
+    "Task Response": "task_response",
+    "Coherence and Cohesion": "coherence_cohesion",
+    "Lexical Resource": "lexical_resource",
+    "Grammatical Range and Accuracy": "grammar",
+}
+
+
+class HistoryStore:
+    """Append-only SQLite history of analysed essays, one row per analysis.
+
+    Rows are indexed by (student, created), so appending and reading one
+    student's recent attempts stay cheap however large the table grows.
+    ``progress`` returns at most ``max_points`` rows: longer histories are
+    averaged into evenly sized buckets inside SQLite.
+    """
+
+    def __init__(self, path: str = "ielts_history.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(f'''CREATE TABLE IF NOT EXISTS attempts (
+                                id INTEGER PRIMARY KEY,
+                                student TEXT NOT NULL,
+                                created REAL NOT NULL,
+                                overall REAL,
+                                {", ".join(f"{column} REAL" for column in CRITERION_COLUMNS.values())},
+                                profile TEXT)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS attempts_student_created ON attempts (student, created)')
+        self._db.commit()
+
+    def append(self, student: str, scores: List[Dict[str, Any]], profile: Optional[str] = None,
+               created: Optional[float] = None) -> int:
+        """Record one analysis (the 'scores' of a report) and return its row id."""
+        by_criterion = {normalize_criterion(score['Name']): score['Score'] for score in scores}
+        values = [by_criterion.get(normalize_criterion(criterion)) for criterion in CRITERIA]
+        present = [value for value in values if value is not None]
+        overall = sum(present) / len(present) if present else None
+        columns = ", ".join(CRITERION_COLUMNS[criterion] for criterion in CRITERIA)
+        with self._lock:
+            cursor = self._db.execute(
+                f'INSERT INTO attempts (student, created, overall, {columns}, profile) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (student, time.time() if created is None else created, overall, *values, profile))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def count(self, student: str, since: Optional[float] = None) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM attempts WHERE student = ? AND created >= ?',
+                                    (student, since or 0.0)).fetchone()[0]
+
+    def progress(self, student: str, since: Optional[float] = None, max_points: int = 100) -> List[Dict[str, Any]]:
+        """Score history of ``student`` since the ``since`` timestamp, downsampled to ``max_points`` rows.
+
+        Each row has 'Date' (the latest attempt in its bucket), 'Overall Score', one
+        key per criterion and 'Attempts' (how many analyses were averaged into it).
+        """
+        columns = [CRITERION_COLUMNS[criterion] for criterion in CRITERIA]
+        averages = ", ".join(f"AVG({column})" for column in ["overall"] + columns)
+        with self._lock:
+            rows = self._db.execute(f'''
+                WITH windowed AS (
+                    SELECT created, overall, {", ".join(columns)},
+                           ROW_NUMBER() OVER (ORDER BY created) - 1 AS position,
+                           COUNT(*) OVER () AS total
+                    FROM attempts WHERE student = ? AND created >= ?
+                )
+                SELECT MAX(created), {averages}, COUNT(*)
+                FROM windowed GROUP BY position * ? / total ORDER BY 1''',
+                (student, since or 0.0, max(1, max_points))).fetchall()
+        return [{
+            'Date': datetime.fromtimestamp(row[0]),
+            'Overall Score': row[1],
+            **dict(zip(CRITERIA, row[2:2 + len(CRITERIA)])),
+            'Attempts': row[-1],
+        } for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
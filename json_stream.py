@@ -0,0 +1,150 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_ARRAY_START = re.compile(r'"results"\s*:\s*\[')
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r'("(?:[^"\\]|\\.)*")|,(\s*[}\]])', re.DOTALL)
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads that also accepts trailing commas before a closing bracket."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(lambda m: m.group(1) or m.group(2), text))
+
+
+class IncrementalResultsParser:
+    """Pull complete objects out of the ``"results"`` array of a JSON document as it streams in.
+
+    ``feed`` accepts arbitrary text chunks (token boundaries do not matter, and a
+    leading code fence or prose is ignored) and returns the criterion objects that
+    became complete with that chunk, in document order. Work per chunk is
+    proportional to the chunk, not to everything received so far.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        # Unconsumed tail of the stream; trimmed whenever no object is open.
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = -1
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._chunks.append(chunk)
+        completed = []
+        if self.done:
+            return completed
+        self._buffer += chunk
+
+        if not self._in_array:
+            match = _ARRAY_START.search(self._buffer)
+            if not match:
+                # Keep enough of the tail to match a key split across chunks.
+                self._buffer = self._buffer[-64:]
+                return completed
+            self._in_array = True
+            self._pos = match.end()
+
+        buffer = self._buffer
+        pos = self._pos
+        while True:
+            if self._escape:
+                if pos >= len(buffer):
+                    break
+                self._escape = False
+                pos += 1
+                continue
+            match = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            i = match.start()
+            char = buffer[i]
+            pos = i + 1
+            if self._in_string:
+                if char == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = i
+                self._depth += 1
+            elif self._depth == 0:
+                # The closing bracket of the results array itself.
+                self.done = True
+                self._buffer = ""
+                return completed
+            else:
+                self._depth -= 1
+                if self._depth == 0 and self._object_start >= 0:
+                    try:
+                        completed.append(loads_lenient(buffer[self._object_start:pos]))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed streamed criterion: {e}")
+                    self._object_start = -1
+
+        if self._object_start >= 0:
+            self._buffer = buffer[self._object_start:]
+            pos -= self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = buffer[pos:]
+            pos = 0
+        self._pos = pos
+        return completed
+
+
+def repair_json(text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Best-effort parse of a JSON object from model output.
+
+    Returns the object and how it was obtained: 'strict' (valid as is),
+    'unfenced' (after removing code fences), 'cleaned' (outermost braces only,
+    dropping surrounding prose and trailing commas) or 'salvaged' (only the
+    complete objects of a damaged or truncated "results" array). Returns
+    ``(None, None)`` when nothing can be recovered.
+    """
+    text = text.strip()
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, 'strict'
+    except json.JSONDecodeError:
+        pass
+
+    unfenced = text.replace("```json", "").replace("```", "").strip()
+    try:
+        parsed = json.loads(unfenced)
+        if isinstance(parsed, dict):
+            return parsed, 'unfenced'
+    except json.JSONDecodeError:
+        pass
+
+    start, end = unfenced.find('{'), unfenced.rfind('}')
+    if start != -1 and end > start:
+        try:
+            parsed = loads_lenient(unfenced[start:end + 1])
+            if isinstance(parsed, dict):
+                return parsed, 'cleaned'
+        except json.JSONDecodeError:
+            pass
+
+    items = [item for item in IncrementalResultsParser().feed(unfenced) if isinstance(item, dict)]
+    if items:
+        return {"results": items}, 'salvaged'
+    return None, None
@@ -0,0 +1,223 @@
+"""Per-analysis stage metrics and process-wide counters/histograms.
+
+Every LLM call made by IELTSEssayAnalyzer is recorded twice: in the
+``AnalysisTrace`` of the analysis it belongs to (returned with the results),
+and in the process-wide ``REGISTRY``, which can be exported in Prometheus text
+format with ``REGISTRY.to_prometheus()``.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def collect(self) -> List[str]:
+        lines = super().collect()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def summary(self, **labels: Any) -> Dict[str, float]:
+        with self._lock:
+            state = self._values.get(_label_key(labels))
+        if not state:
+            return {'count': 0, 'sum': 0.0}
+        return {'count': state[-1], 'sum': state[-2]}
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {_format_value(count)}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs: Any):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines: List[str] = []
+        for _, metric in metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_CALLS = REGISTRY.counter("ielts_llm_calls_total", "LLM calls by pipeline stage and outcome.")
+LLM_TOKENS = REGISTRY.counter("ielts_llm_tokens_total", "Tokens used by pipeline stage and kind (prompt/completion).")
+LLM_COST = REGISTRY.counter("ielts_llm_cost_usd_total", "Estimated OpenAI cost in USD by pipeline stage.")
+STAGE_SECONDS = REGISTRY.histogram("ielts_stage_duration_seconds", "Wall time of each LLM call by pipeline stage.")
+ANALYSES = REGISTRY.counter("ielts_analyses_total", "Analyses by outcome (ok/error/cached/coalesced/revised/unchanged).")
+ANALYSIS_SECONDS = REGISTRY.histogram("ielts_analysis_duration_seconds", "Wall time of a whole analysis.")
+PARSE_FAILURES = REGISTRY.counter("ielts_parse_failures_total", "Evaluator/verifier outputs that could not be parsed, by stage.")
+JSON_REPAIRS = REGISTRY.counter("ielts_json_repairs_total", "Model outputs recovered by the tolerant parser, by stage and method.")
+CRITERIA_REASKED = REGISTRY.counter("ielts_criteria_reasked_total", "Single-criterion re-requests for criteria missing from evaluator output.")
+SUGGESTION_CACHE = REGISTRY.counter("ielts_suggestion_cache_lookups_total", "Per-error suggestion cache lookups by result (hit/miss).")
+COALESCED_REQUESTS = REGISTRY.counter("ielts_coalesced_requests_total", "Analyses answered by an identical analysis already in flight.")
+RATE_LIMIT_QUEUE = REGISTRY.gauge("ielts_rate_limit_queue_depth", "LLM calls waiting for rate-limit capacity, by priority.")
+RATE_LIMIT_WAIT = REGISTRY.histogram("ielts_rate_limit_wait_seconds", "Time LLM calls waited for rate-limit capacity, by priority.")
+RATE_LIMITED = REGISTRY.counter("ielts_rate_limited_total", "429 rate-limit responses from the API, by stage.")
+VERIFIER_DECISIONS = REGISTRY.counter("ielts_verifier_decisions_total", "Verifier passes run or skipped after local checks.")
+VERIFIER_REASONS = REGISTRY.counter("ielts_verifier_reasons_total", "Reasons the verifier was run, by check.")
+
+
+def verifier_skip_rate() -> float:
+    skipped = VERIFIER_DECISIONS.value(decision='skipped')
+    total = skipped + VERIFIER_DECISIONS.value(decision='invoked')
+    return skipped / total if total else 0.0
+
+
+def suggestion_cache_hit_rate() -> float:
+    hits = SUGGESTION_CACHE.value(result='hit')
+    total = hits + SUGGESTION_CACHE.value(result='miss')
+    return hits / total if total else 0.0
+
+
+class AnalysisTrace:
+    """Collects the stage records of a single analysis."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, wall_time: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+               cost: float = 0.0, criterion: Optional[str] = None, ok: bool = True) -> None:
+        entry = {
+            'stage': stage,
+            'wall_time': wall_time,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'cost': cost,
+            'ok': ok,
+        }
+        if criterion is not None:
+            entry['criterion'] = criterion
+        with self._lock:
+            self.stages.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = list(self.stages)
+        return {
+            'wall_time': time.perf_counter() - self.started,
+            'prompt_tokens': sum(s['prompt_tokens'] for s in stages),
+            'completion_tokens': sum(s['completion_tokens'] for s in stages),
+            'total_tokens': sum(s['total_tokens'] for s in stages),
+            'cost': sum(s['cost'] for s in stages),
+            'llm_calls': len(stages),
+            'stages': stages,
+        }
+
+
+current_trace: ContextVar[Optional[AnalysisTrace]] = ContextVar('ielts_analysis_trace', default=None)
+
+
+def record_stage(stage: str, wall_time: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                 cost: float = 0.0, criterion: Optional[str] = None, ok: bool = True) -> None:
+    """Record one LLM call in the current analysis trace (if any) and the process-wide metrics."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(stage, wall_time, prompt_tokens, completion_tokens, cost, criterion, ok)
+    LLM_CALLS.inc(stage=stage, status='ok' if ok else 'error')
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, kind='prompt')
+    LLM_TOKENS.inc(completion_tokens, stage=stage, kind='completion')
+    LLM_COST.inc(cost, stage=stage)
+    STAGE_SECONDS.observe(wall_time, stage=stage)
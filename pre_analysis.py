@@ -0,0 +1,230 @@
+"""Instant local statistics for sanitized essays, computed without any LLM call.
+
+``batch_statistics`` tokenizes every essay once and then works on flat NumPy
+arrays of word ids tagged with the essay they belong to, so a whole batch costs
+little more than a single essay. ``essay_statistics`` is the one-essay form and
+``format_for_prompt`` condenses a result into a line the evaluator prompts can carry.
+"""
+import re
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+MINIMUM_WORDS = 250
+MATTR_WINDOW = 50
+SENTENCE_LENGTH_BUCKETS = (10, 20, 30)
+SENTENCE_LENGTH_LABELS = ("1-9", "10-19", "20-29", "30+")
+
+LINKING_PHRASES = (
+    "however", "moreover", "furthermore", "in addition", "additionally", "therefore", "thus", "hence",
+    "consequently", "as a result", "on the other hand", "in contrast", "nevertheless", "nonetheless",
+    "although", "whereas", "while", "firstly", "secondly", "thirdly", "finally", "lastly",
+    "for example", "for instance", "such as", "in conclusion", "to conclude", "to sum up", "overall",
+    "in my opinion", "because", "since", "besides", "similarly", "likewise", "meanwhile", "instead",
+)
+
+_STOPWORDS = frozenset("""
+a an the and or but if of to in on at by for with from as is are was were be been being it its this that
+these those there their they them he she his her we our you your i my me not no do does did so than then
+can could will would should may might must have has had which who whom what when where why how all any
+""".split())
+
+_WORD = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+_SENTENCE_END = re.compile(r"[.!?]+")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def _paragraph_count(text: str) -> int:
+    paragraphs = [block for block in _PARAGRAPH_BREAK.split(text.strip()) if block.strip()]
+    if len(paragraphs) <= 1:
+        # Many students separate paragraphs with a single line break.
+        paragraphs = [line for line in text.strip().splitlines() if line.strip()]
+    return len(paragraphs)
+
+
+def _phrase_ids(vocabulary: np.ndarray) -> List[np.ndarray]:
+    """LINKING_PHRASES as arrays of vocabulary ids; phrases with a word absent from the batch are dropped."""
+    phrases = []
+    for phrase in LINKING_PHRASES:
+        words = np.array(phrase.split())
+        positions = np.searchsorted(vocabulary, words)
+        positions = np.minimum(positions, len(vocabulary) - 1)
+        if len(vocabulary) and np.all(vocabulary[positions] == words):
+            phrases.append(positions)
+    return phrases
+
+
+def _window_matches(ids: np.ndarray, joined: np.ndarray, phrase: np.ndarray) -> np.ndarray:
+    """Start positions where ``phrase`` occurs in ``ids``; ``joined[i]`` says whether words i and i+1 may be combined."""
+    n = len(phrase)
+    if len(ids) < n:
+        return np.empty(0, dtype=np.int64)
+    hits = np.ones(len(ids) - n + 1, dtype=bool)
+    for offset, word in enumerate(phrase):
+        hits &= ids[offset:len(ids) - n + 1 + offset] == word
+    for offset in range(n - 1):
+        hits &= joined[offset:len(ids) - n + 1 + offset]
+    return np.flatnonzero(hits)
+
+
+def _mattr(ids: np.ndarray, window: int = MATTR_WINDOW) -> float:
+    """Moving-average type-token ratio; plain TTR for texts shorter than ``window``."""
+    if len(ids) == 0:
+        return 0.0
+    if len(ids) < window:
+        return len(np.unique(ids)) / len(ids)
+    windows = np.sort(np.lib.stride_tricks.sliding_window_view(ids, window), axis=1)
+    distinct = 1 + np.count_nonzero(np.diff(windows, axis=1), axis=1)
+    return float(distinct.mean() / window)
+
+
+def _repeated_ngrams(ids: np.ndarray, essay_of: np.ndarray, joined: np.ndarray, vocabulary: np.ndarray,
+                     stopword: np.ndarray, n_essays: int, n: int, min_count: int, top: int) -> List[List[Dict[str, Any]]]:
+    found: List[List[Dict[str, Any]]] = [[] for _ in range(n_essays)]
+    if len(ids) < n:
+        return found
+    valid = np.ones(len(ids) - n + 1, dtype=bool)
+    for offset in range(n - 1):
+        valid &= joined[offset:len(ids) - n + 1 + offset]
+    grams = np.stack([essay_of[:len(ids) - n + 1]] + [ids[offset:len(ids) - n + 1 + offset] for offset in range(n)],
+                     axis=1)[valid]
+    # An n-gram made only of function words ("of the") says nothing about the student's writing.
+    grams = grams[~np.all(stopword[grams[:, 1:]], axis=1)]
+    if not len(grams):
+        return found
+    unique, counts = np.unique(grams, axis=0, return_counts=True)
+    keep = counts >= min_count
+    unique, counts = unique[keep], counts[keep]
+    order = np.lexsort((-counts, unique[:, 0]))
+    for row in order:
+        essay = int(unique[row, 0])
+        if len(found[essay]) < top:
+            found[essay].append({'ngram': " ".join(vocabulary[unique[row, 1:]]), 'count': int(counts[row])})
+    return found
+
+
+def batch_statistics(texts: Sequence[str]) -> List[Dict[str, Any]]:
+    """Statistics for every text in ``texts`` (expected to be sanitized essays)."""
+    n_essays = len(texts)
+    if n_essays == 0:
+        return []
+
+    word_lists, word_sentences, sentence_lengths, sentence_essays, paragraphs = [], [], [], [], []
+    sentence_offset = 0
+    for index, text in enumerate(texts):
+        matches = list(_WORD.finditer(text))
+        word_lists.append([match.group().lower() for match in matches])
+        # Each word belongs to the sentence whose terminator is the first one after it.
+        ends = np.array([match.end() for match in _SENTENCE_END.finditer(text)], dtype=np.int64)
+        starts = np.array([match.start() for match in matches], dtype=np.int64)
+        sentence_index = np.searchsorted(ends, starts)
+        word_sentences.append(sentence_index + sentence_offset)
+        sentence_offset += len(ends) + 1
+        lengths = np.bincount(sentence_index, minlength=len(ends) + 1)
+        lengths = lengths[lengths > 0]
+        sentence_lengths.append(lengths)
+        sentence_essays.append(np.full(len(lengths), index))
+        paragraphs.append(_paragraph_count(text))
+
+    word_counts = np.array([len(words) for words in word_lists], dtype=np.int64)
+    all_words = np.array([word for words in word_lists for word in words], dtype=str)
+    essay_of = np.repeat(np.arange(n_essays), word_counts)
+    if len(all_words):
+        vocabulary, ids = np.unique(all_words, return_inverse=True)
+    else:
+        vocabulary, ids = np.array([], dtype=str), np.empty(0, dtype=np.int64)
+    # Phrases and n-grams are only counted within one sentence (and so within one essay).
+    sentence_of = np.concatenate(word_sentences)
+    same_sentence = sentence_of[:-1] == sentence_of[1:] if len(ids) > 1 else np.empty(0, dtype=bool)
+    stopword = np.isin(vocabulary, list(_STOPWORDS))
+
+    # Lexical diversity: distinct (essay, word) pairs give the number of types per essay.
+    pair_keys = np.unique(essay_of * max(len(vocabulary), 1) + ids)
+    types = np.bincount(pair_keys // max(len(vocabulary), 1), minlength=n_essays)
+    boundaries = np.concatenate([[0], np.cumsum(word_counts)])
+
+    # Sentence lengths, grouped by essay with bincount instead of a Python loop per sentence.
+    lengths = np.concatenate(sentence_lengths) if sentence_lengths else np.empty(0, dtype=np.int64)
+    owners = np.concatenate(sentence_essays).astype(np.int64) if sentence_essays else np.empty(0, dtype=np.int64)
+    sentence_counts = np.bincount(owners, minlength=n_essays)
+    safe_counts = np.maximum(sentence_counts, 1)
+    means = np.bincount(owners, weights=lengths, minlength=n_essays) / safe_counts
+    variances = np.bincount(owners, weights=lengths.astype(float) ** 2, minlength=n_essays) / safe_counts - means ** 2
+    buckets = np.digitize(lengths, SENTENCE_LENGTH_BUCKETS)
+    histogram = np.bincount(owners * len(SENTENCE_LENGTH_LABELS) + buckets,
+                            minlength=n_essays * len(SENTENCE_LENGTH_LABELS)).reshape(n_essays, -1)
+
+    # Linking words and phrases, counted per essay for each phrase.
+    phrase_ids = _phrase_ids(vocabulary)
+    phrase_counts = np.zeros((n_essays, len(phrase_ids)), dtype=np.int64)
+    for column, phrase in enumerate(phrase_ids):
+        phrase_counts[:, column] = np.bincount(essay_of[_window_matches(ids, same_sentence, phrase)], minlength=n_essays)
+    linking_totals = phrase_counts.sum(axis=1)
+
+    bigrams = _repeated_ngrams(ids, essay_of, same_sentence, vocabulary, stopword, n_essays, 2, 3, 5)
+    trigrams = _repeated_ngrams(ids, essay_of, same_sentence, vocabulary, stopword, n_essays, 3, 2, 5)
+
+    results = []
+    for index in range(n_essays):
+        words = int(word_counts[index])
+        essay_ids = ids[boundaries[index]:boundaries[index + 1]]
+        essay_lengths = sentence_lengths[index]
+        used = np.flatnonzero(phrase_counts[index])
+        most_used = sorted(((" ".join(vocabulary[phrase_ids[column]]), int(phrase_counts[index, column]))
+                            for column in used), key=lambda item: -item[1])[:5]
+        results.append({
+            'word_count': words,
+            'paragraph_count': paragraphs[index],
+            'under_minimum': words < MINIMUM_WORDS,
+            'minimum_words': MINIMUM_WORDS,
+            'sentence_count': int(sentence_counts[index]),
+            'sentence_length': {
+                'mean': round(float(means[index]), 1),
+                'std': round(float(np.sqrt(max(variances[index], 0.0))), 1),
+                'min': int(essay_lengths.min()) if len(essay_lengths) else 0,
+                'median': float(np.median(essay_lengths)) if len(essay_lengths) else 0.0,
+                'max': int(essay_lengths.max()) if len(essay_lengths) else 0,
+                'histogram': dict(zip(SENTENCE_LENGTH_LABELS, histogram[index].tolist())),
+            },
+            'lexical_diversity': {
+                'type_token_ratio': round(float(types[index] / words), 3) if words else 0.0,
+                'root_ttr': round(float(types[index] / np.sqrt(words)), 2) if words else 0.0,
+                'mattr': round(_mattr(essay_ids), 3),
+            },
+            'repeated_ngrams': trigrams[index] + [
+                bigram for bigram in bigrams[index]
+                # A bigram that only ever occurs inside a reported trigram adds nothing.
+                if not any(bigram['ngram'] in trigram['ngram'] and trigram['count'] >= bigram['count']
+                           for trigram in trigrams[index])],
+            'linking_words': {
+                'count': int(linking_totals[index]),
+                'per_100_words': round(float(linking_totals[index] * 100 / words), 1) if words else 0.0,
+                'per_sentence': round(float(linking_totals[index] / safe_counts[index]), 2),
+                'most_used': [{'phrase': phrase, 'count': count} for phrase, count in most_used],
+            },
+        })
+    return results
+
+
+def essay_statistics(text: str) -> Dict[str, Any]:
+    return batch_statistics([text])[0]
+
+
+def format_for_prompt(stats: Dict[str, Any]) -> str:
+    """One compact line of the statistics for an LLM prompt."""
+    sentence = stats['sentence_length']
+    diversity = stats['lexical_diversity']
+    linking = stats['linking_words']
+    parts = [
+        f"{stats['word_count']} words" + (f" (under the {stats['minimum_words']}-word minimum)" if stats['under_minimum'] else ""),
+        f"{stats['paragraph_count']} paragraphs",
+        f"{stats['sentence_count']} sentences, mean length {sentence['mean']} words (sd {sentence['std']})",
+        f"type-token ratio {diversity['type_token_ratio']}, MATTR {diversity['mattr']}",
+        f"linking words {linking['per_100_words']} per 100 words"
+        + (" (" + ", ".join(f"{item['phrase']} x{item['count']}" for item in linking['most_used'][:3]) + ")"
+           if linking['most_used'] else ""),
+    ]
+    if stats['repeated_ngrams']:
+        parts.append("repeated phrases: " + ", ".join(f"'{item['ngram']}' x{item['count']}"
+                                                      for item in stats['repeated_ngrams'][:3]))
+    return "; ".join(parts)
@@ -0,0 +1,247 @@
+"""Client-side OpenAI rate limiting shared by every analyzer in the process.
+
+Each LLM call first acquires capacity from a ``RateLimitScheduler``: one
+request from the requests-per-minute bucket and its estimated tokens (prompt
+length plus the expected completion) from the tokens-per-minute bucket. Once
+the call finishes, the estimate is corrected with the actual usage.
+
+Calls wait in two priority classes: queued ``interactive`` calls (the UI, POST
+/grade) always start before queued ``batch`` calls (batch_grade.py, POST /jobs).
+The class of a call comes from the ``request_priority`` context variable, set
+with ``priority("batch")``. A 429 response blocks every caller of the scheduler
+for the server's Retry-After, or an exponential backoff when none is given.
+
+Limits apply per process: a batch grader running beside the app should get a
+smaller share (batch_grade.py --rpm/--tpm) so both stay under the account limits.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import RATE_LIMIT_QUEUE, RATE_LIMIT_WAIT, RATE_LIMITED
+
+PRIORITIES = ("interactive", "batch")
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("IELTS_OPENAI_RPM", "500"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("IELTS_OPENAI_TPM", "200000"))
+
+request_priority: ContextVar[str] = ContextVar('ielts_request_priority', default="interactive")
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Run the LLM calls made inside the block in priority class ``name``."""
+    if name not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}, got {name!r}")
+    token = request_priority.set(name)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def estimate_tokens(texts: Iterable[str], completion_tokens: int) -> int:
+    """Rough token count of a call: about four characters per prompt token plus the expected completion."""
+    return sum(len(text) for text in texts) // 4 + completion_tokens
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    return getattr(error, 'status_code', None) == 429
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The Retry-After hint of a 429 error raised by the OpenAI client, if it has one."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('retry-after')))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills at ``per_minute`` units a minute up to ``capacity`` (one minute's worth by default).
+
+    The level may go negative when a call turns out larger than estimated;
+    later calls then wait until the debt is refilled. Not thread-safe on its own.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (amounts above capacity wait for a full bucket)."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.wakeup: Optional[asyncio.Future] = None
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimitScheduler:
+    """Requests/min and tokens/min buckets with a two-class priority queue and 429 backoff.
+
+    Safe to share between threads and event loops: waiting callers are woken
+    on their own loop. Only the caller at the head of the queue (interactive
+    before batch, then first come first served) waits for bucket capacity.
+    """
+
+    def __init__(self,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 base_backoff: float = 1.0,
+                 max_backoff: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._strikes = 0
+
+    def queued(self) -> Dict[str, int]:
+        """Number of waiting calls per priority class."""
+        with self._lock:
+            return self._depths()
+
+    def _depths(self) -> Dict[str, int]:
+        depths = dict.fromkeys(PRIORITIES, 0)
+        for rank, _, _ in self._queue:
+            depths[PRIORITIES[rank]] += 1
+        return depths
+
+    def _publish_depths(self) -> None:
+        for name, depth in self._depths().items():
+            RATE_LIMIT_QUEUE.set(depth, priority=name)
+
+    def _wake_head(self) -> None:
+        if self._queue:
+            waiter = self._queue[0][2]
+            if waiter.wakeup is not None:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.wakeup)
+
+    def _grant_delay(self, entry: Tuple[int, int, _Waiter], tokens: int) -> Optional[float]:
+        """0.0 when ``entry`` was granted; else seconds to wait, or None to wait until woken."""
+        if self._queue[0] is not entry:
+            return None
+        now = self.clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if delay > 0:
+            return delay
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        heapq.heappop(self._queue)
+        return 0.0
+
+    async def acquire(self, tokens: int, priority: Optional[str] = None) -> float:
+        """Wait until a call estimated at ``tokens`` tokens may start; returns the seconds waited."""
+        priority = priority or request_priority.get()
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, got {priority!r}")
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop)
+        entry = (PRIORITIES.index(priority), next(self._sequence), waiter)
+        started = self.clock()
+        granted = False
+        with self._lock:
+            heapq.heappush(self._queue, entry)
+            self._publish_depths()
+        try:
+            while True:
+                waiter.wakeup = loop.create_future()
+                with self._lock:
+                    delay = self._grant_delay(entry, tokens)
+                if delay == 0.0:
+                    granted = True
+                    break
+                try:
+                    await asyncio.wait_for(waiter.wakeup, delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                if not granted:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                self._publish_depths()
+                self._wake_head()
+        waited = self.clock() - started
+        RATE_LIMIT_WAIT.observe(waited, priority=priority)
+        return waited
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once a call's actual usage is known (0 when unknown)."""
+        if not actual or actual == estimated:
+            return
+        with self._lock:
+            if actual > estimated:
+                self.tokens.take(actual - estimated)
+            else:
+                self.tokens.give_back(estimated - actual)
+                self._wake_head()
+
+    def report_rate_limited(self, retry_after: Optional[float] = None, stage: str = "") -> float:
+        """Block all callers after a 429: for ``retry_after`` seconds, else exponential backoff with jitter."""
+        with self._lock:
+            self._strikes += 1
+            if retry_after is None:
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._strikes - 1))
+                retry_after = backoff * random.uniform(0.5, 1.0)
+            self._blocked_until = max(self._blocked_until, self.clock() + retry_after)
+        RATE_LIMITED.inc(stage=stage)
+        return retry_after
+
+    def report_success(self) -> None:
+        with self._lock:
+            self._strikes = 0
+
+
+_shared_schedulers: Dict[Tuple[Tuple[str, Any], ...], RateLimitScheduler] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler(**settings: Any) -> RateLimitScheduler:
+    """The process-wide RateLimitScheduler for ``settings`` (see RateLimitScheduler), created on first use."""
+    key = tuple(sorted(settings.items()))
+    with _shared_lock:
+        scheduler = _shared_schedulers.get(key)
+        if scheduler is None:
+            scheduler = _shared_schedulers[key] = RateLimitScheduler(**settings)
+        return scheduler
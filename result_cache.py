@@ -0,0 +1,132 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Build a content-addressed key from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for analysis results and per-error suggestions.
+
+    A bounded in-memory LRU sits in front of an optional SQLite file. Both tiers
+    honour ``ttl_seconds``; the SQLite tier evicts least recently used rows once it
+    holds more than ``max_disk_entries``. Values must be JSON-serializable and are
+    returned as fresh copies, so callers may mutate them freely.
+    """
+
+    def __init__(self,
+                 max_memory_entries: int = 256,
+                 path: Optional[str] = None,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_disk_entries: int = 10000):
+        self.max_memory_entries = max(0, max_memory_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max(1, max_disk_entries)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0}
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS cache (
+                                    key TEXT PRIMARY KEY,
+                                    value TEXT NOT NULL,
+                                    created REAL NOT NULL,
+                                    accessed REAL NOT NULL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        if not self.max_memory_entries:
+            return
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value, created FROM cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self._stats['disk_hits'] += 1
+                        return json.loads(value)
+                    self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+                    self._db.commit()
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, payload)
+            self._stats['sets'] += 1
+            if self._db is None:
+                return
+            self._db.execute('INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                             (key, payload, now, now))
+            if self.ttl_seconds is not None:
+                self._db.execute('DELETE FROM cache WHERE created < ?', (now - self.ttl_seconds,))
+            overflow = self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute('DELETE FROM cache WHERE key IN '
+                                 '(SELECT key FROM cache ORDER BY accessed LIMIT ?)', (overflow,))
+                self._stats['evictions'] += overflow
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM cache')
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
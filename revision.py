@@ -0,0 +1,154 @@
+"""Diff a revised essay against the version that was last analysed.
+
+Paragraphs (separated by blank lines, as in pre_analysis) are matched first;
+paragraphs that were edited are then matched sentence by sentence, so a
+one-word edit only marks its sentence as changed. The result is the list of
+unchanged spans, whose errors can be kept by shifting their offsets, and the
+list of changed regions, which are all that needs to be sent for re-evaluation.
+"""
+import difflib
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"[^.!?\s][^.!?]*[.!?]*")
+
+# (old_start, old_end, new_start): old[old_start:old_end] appears unchanged at new_start.
+Unchanged = Tuple[int, int, int]
+# (old_start, old_end, new_start, new_end): old[old_start:old_end] became new[new_start:new_end];
+# either side may be empty for pure insertions and deletions.
+Changed = Tuple[int, int, int, int]
+
+
+def paragraph_spans(text: str) -> List[Tuple[int, int]]:
+    spans, start = [], 0
+    for match in list(_PARAGRAPH_BREAK.finditer(text)) + [None]:
+        end = match.start() if match else len(text)
+        chunk = text[start:end]
+        if chunk.strip():
+            spans.append((start + len(chunk) - len(chunk.lstrip()), end - (len(chunk) - len(chunk.rstrip()))))
+        if match:
+            start = match.end()
+    return spans
+
+
+def sentence_spans(text: str, spans: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """The sentences of the given spans of ``text``, with offsets into ``text``."""
+    return [(start + match.start(), start + match.end() - (len(match.group()) - len(match.group().rstrip())))
+            for start, end in spans for match in _SENTENCE.finditer(text[start:end])]
+
+
+def _anchor(units: Sequence[Tuple[int, int]], index: int) -> int:
+    """Offset where an empty side of a change sits: the start of units[index], or the end of the one before."""
+    if index < len(units):
+        return units[index][0]
+    return units[-1][1] if units else 0
+
+
+def diff_essays(old: str, new: str) -> Tuple[List[Unchanged], List[Changed]]:
+    """Unchanged spans (sorted by old offset) and changed regions (sorted by new offset) between two versions."""
+    unchanged: List[Unchanged] = []
+    changed: List[Changed] = []
+
+    def match(old_units: List[Tuple[int, int]], new_units: List[Tuple[int, int]], refine: bool) -> None:
+        matcher = difflib.SequenceMatcher(None, [old[s:e] for s, e in old_units], [new[s:e] for s, e in new_units],
+                                          autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                unchanged.extend((old_units[i][0], old_units[i][1], new_units[j][0])
+                                 for i, j in zip(range(i1, i2), range(j1, j2)))
+            elif tag == 'replace' and refine:
+                match(sentence_spans(old, old_units[i1:i2]), sentence_spans(new, new_units[j1:j2]), False)
+            else:
+                changed.append((_anchor(old_units, i1) if i1 == i2 else old_units[i1][0],
+                                old_units[i2 - 1][1] if i2 > i1 else _anchor(old_units, i1),
+                                _anchor(new_units, j1) if j1 == j2 else new_units[j1][0],
+                                new_units[j2 - 1][1] if j2 > j1 else _anchor(new_units, j1)))
+
+    match(paragraph_spans(old), paragraph_spans(new), True)
+
+    # Neighbouring unchanged spans with the same shift and identical text between them are one span,
+    # so errors crossing a sentence boundary survive too.
+    merged: List[Unchanged] = []
+    for span in sorted(unchanged):
+        if merged:
+            old_start, old_end, new_start = merged[-1]
+            shift = new_start - old_start
+            if span[2] - span[0] == shift and old[old_end:span[0]] == new[old_end + shift:span[2]]:
+                merged[-1] = (old_start, span[1], new_start)
+                continue
+        merged.append(span)
+
+    regions: List[Changed] = []
+    for region in sorted(changed, key=lambda region: (region[2], region[0])):
+        if regions:
+            previous = regions[-1]
+            if not new[previous[3]:region[2]].strip() and not old[previous[1]:region[0]].strip():
+                regions[-1] = (min(previous[0], region[0]), max(previous[1], region[1]), previous[2], region[3])
+                continue
+        regions.append(region)
+    return merged, regions
+
+
+def changed_fraction(old: str, new: str, changed: Sequence[Changed]) -> float:
+    """Share of both versions' characters covered by the changed regions."""
+    total = len(old) + len(new)
+    return sum((old_end - old_start) + (new_end - new_start)
+               for old_start, old_end, new_start, new_end in changed) / total if total else 0.0
+
+
+def _error_span(error: Dict[str, Any], old: str) -> Optional[Tuple[int, int]]:
+    """The error's reported offsets if they hold its text, else the first occurrence of the text, else the offsets."""
+    start, end = error.get('start'), error.get('end')
+    valid = isinstance(start, int) and isinstance(end, int) and 0 <= start < end <= len(old)
+    error_text = error.get('error_text') or ""
+    if valid and (not error_text or old[start:end] == error_text):
+        return start, end
+    found = old.find(error_text) if error_text else -1
+    if found != -1:
+        return found, found + len(error_text)
+    return (start, end) if valid else None
+
+
+def carry_over_errors(errors: Sequence[Dict[str, Any]], old: str,
+                      unchanged: Sequence[Unchanged]) -> Tuple[List[Dict[str, Any]], int]:
+    """Errors lying entirely in unchanged text, with offsets moved to the new version, and how many were dropped."""
+    kept, dropped = [], 0
+    for error in errors:
+        span = _error_span(error, old)
+        region = next((region for region in unchanged
+                       if span and region[0] <= span[0] and span[1] <= region[1]), None)
+        if region is None:
+            dropped += 1
+            continue
+        shift = region[2] - region[0]
+        kept.append({**error, 'start': span[0] + shift, 'end': span[1] + shift})
+    return kept, dropped
+
+
+def locate_in_region(error_text: str, new: str, region: Changed) -> Optional[Tuple[int, int]]:
+    """Offsets of ``error_text`` inside the new side of ``region`` (exact match first, then ignoring case)."""
+    _, _, start, end = region
+    if not error_text:
+        return None
+    found = new.find(error_text, start, end)
+    if found == -1:
+        found = new.lower().find(error_text.lower(), start, end)
+    return (found, found + len(error_text)) if found != -1 else None
+
+
+def format_passages(old: str, new: str, changed: Sequence[Changed], context: int = 160) -> str:
+    """The changed regions for the revision prompt: old text, and new text between >>> and <<< with a little context."""
+    sentences = sentence_spans(new, paragraph_spans(new))
+    passages = []
+    for number, (old_start, old_end, new_start, new_end) in enumerate(changed, 1):
+        before = next((new[s:e] for s, e in reversed(sentences) if e <= new_start), "")[-context:]
+        after = next((new[s:e] for s, e in sentences if s >= new_end), "")[:context]
+        if new_start == new_end:
+            revised = "(this text was removed)"
+        else:
+            revised = " ".join(part for part in (before, f">>>{new[new_start:new_end]}<<<", after) if part)
+        passages.append(f"Passage {number}:\n"
+                        f"Before: {old[old_start:old_end] or '(nothing; this text was added)'}\n"
+                        f"After: {revised}")
+    return "\n\n".join(passages)
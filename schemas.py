@@ -0,0 +1,92 @@
+"""Typed schema of the evaluator/verifier output, used for provider-side structured output.
+
+Field aliases are the JSON keys the rest of the pipeline already uses, so
+``model_dump(by_alias=True)`` yields exactly the dicts ``_parse_json`` would.
+"""
+from typing import Any, Dict, List, Literal, Type
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, ConfigDict, Field
+
+CriterionName = Literal["Task Response", "Coherence and Cohesion", "Lexical Resource",
+                        "Grammatical Range and Accuracy"]
+
+
+class _Schema(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class EssayError(_Schema):
+    start: int = Field(description="Character offset where the problematic text starts in the essay")
+    end: int = Field(description="Character offset just past the problematic text")
+    error_text: str = Field(description="The exact problematic text, copied from the essay")
+    description: str
+    reasoning: str = Field(alias="Reasoning for Error Identification")
+
+
+class CriterionEvaluation(_Schema):
+    name: CriterionName = Field(alias="Name")
+    score: float = Field(alias="Score", description="Band score in 0.5 steps from 0 to 9")
+    reasoning: str = Field(alias="Reasoning for Score")
+    strengths: List[str] = Field(alias="Strengths")
+    errors: List[EssayError] = Field(alias="Errors")
+
+
+class EssayEvaluation(_Schema):
+    results: List[CriterionEvaluation]
+
+
+class VerifiedEssayEvaluation(EssayEvaluation):
+    verifier_comments: str = Field(alias="Verifier's Comments")
+
+
+class Suggestion(_Schema):
+    error_text: str
+    suggestion: str
+    example: str
+
+
+class CriterionEvaluationWithSuggestions(CriterionEvaluation):
+    suggestions: List[Suggestion] = Field(alias="Suggestions")
+    general_advice: List[str] = Field(alias="General Advice")
+    exercises: List[str] = Field(alias="Recommended Exercises")
+
+
+class FusedEssayEvaluation(_Schema):
+    """Output of the single-call "fast" profile: the evaluation with suggestions inline."""
+    results: List[CriterionEvaluationWithSuggestions]
+
+
+class RevisedError(_Schema):
+    error_text: str = Field(description="The exact problematic text, copied from the new text of a changed passage")
+    description: str
+    reasoning: str = Field(alias="Reasoning for Error Identification")
+
+
+class RevisedCriterion(_Schema):
+    name: CriterionName = Field(alias="Name")
+    score: float = Field(alias="Score", description="Band score of the whole revised essay in 0.5 steps from 0 to 9")
+    reasoning: str = Field(alias="Reasoning for Score")
+    errors: List[RevisedError] = Field(alias="Errors")
+
+
+class RevisionEvaluation(_Schema):
+    """Output of the incremental re-evaluation of an edited essay: whole-essay scores, errors of the changed text."""
+    results: List[RevisedCriterion]
+
+
+def response_format(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAI ``response_format`` requesting strict JSON-schema output for ``schema``."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.__name__,
+            "schema": convert_to_openai_tool(schema, strict=True)["function"]["parameters"],
+            "strict": True,
+        },
+    }
+
+
+def validate(schema: Type[BaseModel], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate parsed JSON against ``schema`` and return it with the pipeline's key names."""
+    return schema.model_validate(data).model_dump(by_alias=True)
@@ -0,0 +1,60 @@
+import asyncio
+import concurrent.futures
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    The first caller for a key runs the computation; callers arriving while it
+    is still running wait for its outcome instead of starting their own. The
+    outcome is held in a ``concurrent.futures.Future``, so waiting works across
+    threads and event loops (the synchronous API shares one background loop,
+    while async callers such as the grading service bring their own).
+    Followers get a deep copy of the result, or the same exception.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return the result for ``key`` and whether it was shared from another caller's computation."""
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = concurrent.futures.Future()
+            if leader:
+                break
+            try:
+                # shield: a follower giving up must not cancel the leader's future for everyone else.
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The leader was cancelled, not this caller: try again, possibly as the new leader.
+                    continue
+                raise
+            return copy.deepcopy(result), True
+
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
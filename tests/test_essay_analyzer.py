@@ -0,0 +1,49 @@
+import time
+import unittest
+
+from essay_analyzer import IELTSEssayAnalyzer
+from fake_llm import fake_chat_model_factory
+from result_cache import ResultCache
+
+ESSAY = ("Technology has changed education. Many schools use tablets in every classroom.\n\n"
+         "However, some teachers disagree. They says screens distract students from reading.\n\n"
+         "In conclusion, a balance between screens and books is important for children.")
+
+
+class CallbackError(Exception):
+    pass
+
+
+class RunSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResultCache()
+        self.analyzer = IELTSEssayAnalyzer(profile="standard", cache=self.cache, coalesce_requests=False,
+                                           chat_model_factory=fake_chat_model_factory(latency=0.1))
+
+    def llm_calls(self) -> int:
+        return len(self.analyzer.llm.calls) + len(self.analyzer.suggestions_llm.calls)
+
+    def test_raising_callback_stops_the_analysis(self):
+        def on_criterion(criterion: dict) -> None:
+            raise CallbackError(criterion['Name'])
+
+        with self.assertRaises(CallbackError):
+            self.analyzer.analyze_essay(ESSAY, "Technology in education", on_criterion=on_criterion)
+        calls = self.llm_calls()
+        # Long enough for the suggestion calls of an abandoned analysis to finish.
+        time.sleep(0.5)
+        self.assertEqual(self.llm_calls(), calls)
+        self.assertEqual(len(self.analyzer.suggestions_llm.calls), 0)
+        key = self.analyzer._cache_key(self.analyzer.sanitize_input(ESSAY), "Technology in education")
+        self.assertIsNone(self.cache.get(key))
+
+    def test_analysis_completes_with_a_working_callback(self):
+        seen = []
+        scores, _ = self.analyzer.analyze_essay(ESSAY, "Technology in education", on_criterion=seen.append)
+        self.assertEqual(len(scores), 4)
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(self.analyzer.suggestions_llm.calls), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
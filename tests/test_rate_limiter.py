@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+import unittest
+from typing import Callable, List
+
+from rate_limiter import RateLimitScheduler, TokenBucket, priority, request_priority
+
+
+class FakeClock:
+    """A clock that only moves when told to; waiters keep polling it on their real-time timeouts."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.005)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_refills_at_rate_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(3), 3.0)
+        clock.advance(2)
+        self.assertAlmostEqual(bucket.wait_time(3), 1.0)
+        clock.advance(3600)
+        self.assertEqual(bucket.wait_time(60), 0.0)
+        self.assertEqual(bucket.level, 60)
+
+    def test_debt_delays_later_calls(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.take(90)
+        self.assertAlmostEqual(bucket.wait_time(1), 31.0)
+
+    def test_amounts_above_capacity_wait_for_a_full_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.take(30)
+        self.assertAlmostEqual(bucket.wait_time(500), 30.0)
+
+
+class RateLimitSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # 64 requests a second (a step of 1/64s is exact in binary): a drained bucket makes waiters
+        # poll every ~16ms of real time, but nothing is granted until the fake clock moves.
+        self.scheduler = RateLimitScheduler(requests_per_minute=64 * 60, tokens_per_minute=64 * 60, clock=self.clock)
+        self.granted: List[str] = []
+
+    def drain_requests(self) -> None:
+        self.scheduler.requests.level = 0.0
+
+    def start(self, name: str, tokens: int = 1, priority_name: str = "interactive") -> asyncio.Task:
+        async def acquire() -> None:
+            await self.scheduler.acquire(tokens, priority=priority_name)
+            self.granted.append(name)
+        return asyncio.create_task(acquire())
+
+    async def grant_one(self) -> None:
+        before = len(self.granted)
+        self.clock.advance(1 / 64)
+        await wait_until(lambda: len(self.granted) > before)
+
+    async def test_grants_immediately_with_capacity(self):
+        waited = await self.scheduler.acquire(10)
+        self.assertEqual(waited, 0.0)
+        self.assertEqual(self.scheduler.queued(), {'interactive': 0, 'batch': 0})
+
+    async def test_interactive_granted_before_queued_batch(self):
+        self.drain_requests()
+        tasks = [self.start("batch-1", priority_name="batch"), self.start("batch-2", priority_name="batch")]
+        await wait_until(lambda: self.scheduler.queued()['batch'] == 2)
+        tasks.append(self.start("interactive", priority_name="interactive"))
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.granted, [])
+
+        for _ in range(3):
+            await self.grant_one()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1.0)
+        self.assertEqual(self.granted, ["interactive", "batch-1", "batch-2"])
+
+    async def test_priority_defaults_to_context(self):
+        self.drain_requests()
+        with priority("batch"):
+            task = asyncio.create_task(self.scheduler.acquire(1))
+        await wait_until(lambda: self.scheduler.queued()['batch'] == 1)
+        self.clock.advance(1 / 64)
+        await asyncio.wait_for(task, 1.0)
+        self.assertEqual(request_priority.get(), "interactive")
+
+    async def test_unknown_priority_rejected(self):
+        with self.assertRaises(ValueError):
+            await self.scheduler.acquire(1, priority="urgent")
+        with self.assertRaises(ValueError):
+            with priority("urgent"):
+                pass
+
+    async def test_cancelled_head_wakes_next_waiter(self):
+        self.scheduler.tokens.level = 5.0
+        # The head needs more tokens than there are and waits ~seconds; the second
+        # fits but is not at the head, so it waits until woken.
+        head = self.start("head", tokens=500)
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 1)
+        follower = self.start("follower", tokens=1)
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.granted, [])
+
+        head.cancel()
+        await asyncio.wait_for(follower, 1.0)
+        self.assertEqual(self.granted, ["follower"])
+        self.assertTrue(head.cancelled())
+        self.assertEqual(self.scheduler.queued(), {'interactive': 0, 'batch': 0})
+
+    async def test_cancelled_head_wakes_waiter_on_another_loop(self):
+        self.scheduler.tokens.level = 5.0
+        head = self.start("head", tokens=500)
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 1)
+
+        done = threading.Event()
+
+        def other_thread() -> None:
+            asyncio.run(self.scheduler.acquire(1))
+            done.set()
+
+        thread = threading.Thread(target=other_thread, daemon=True)
+        thread.start()
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 2)
+        head.cancel()
+        await wait_until(done.is_set)
+        thread.join(1.0)
+
+    async def test_settle_corrects_the_token_estimate(self):
+        self.scheduler.tokens.level = 1000.0
+        self.scheduler.settle(estimated=100, actual=40)
+        self.assertAlmostEqual(self.scheduler.tokens.level, 1060.0)
+        self.scheduler.settle(estimated=100, actual=150)
+        self.assertAlmostEqual(self.scheduler.tokens.level, 1010.0)
+        self.scheduler.settle(estimated=100, actual=0)
+        self.assertAlmostEqual(self.scheduler.tokens.level, 1010.0)
+
+    async def test_settle_returning_tokens_wakes_the_head(self):
+        self.scheduler.tokens.level = 0.0
+        waiter = self.start("waiter", tokens=50)
+        await wait_until(lambda: self.scheduler.queued()['interactive'] == 1)
+        self.scheduler.settle(estimated=100, actual=40)
+        await asyncio.wait_for(waiter, 1.0)
+        self.assertEqual(self.granted, ["waiter"])
+
+    async def test_rate_limit_blocks_until_retry_after(self):
+        self.scheduler.report_rate_limited(retry_after=1 / 16)
+        waiter = self.start("waiter")
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.granted, [])
+        self.clock.advance(1 / 16)
+        await asyncio.wait_for(waiter, 1.0)
+        self.assertEqual(self.granted, ["waiter"])
+
+    async def test_backoff_doubles_until_success(self):
+        scheduler = RateLimitScheduler(base_backoff=1.0, max_backoff=3.0, clock=self.clock)
+        delays = [scheduler.report_rate_limited() for _ in range(3)]
+        self.assertTrue(0.5 <= delays[0] <= 1.0)
+        self.assertTrue(1.0 <= delays[1] <= 2.0)
+        self.assertTrue(1.5 <= delays[2] <= 3.0)
+        scheduler.report_success()
+        self.assertTrue(0.5 <= scheduler.report_rate_limited() <= 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+
+from revision import (carry_over_errors, changed_fraction, diff_essays, format_passages, locate_in_region,
+                      paragraph_spans)
+
+OLD = ("Technology has changed education. Many schools use tablets.\n\n"
+       "However, some teachers disagree. They says screens distract students.\n\n"
+       "In conclusion, balance is important.")
+
+
+def error(essay: str, text: str, **extra) -> dict:
+    start = essay.index(text)
+    return {'start': start, 'end': start + len(text), 'error_text': text, **extra}
+
+
+class DiffEssaysTest(unittest.TestCase):
+    def test_paragraph_spans_skip_blank_lines_and_edges(self):
+        text = "\n  First one.\n\n\n Second one.  \n"
+        self.assertEqual([text[start:end] for start, end in paragraph_spans(text)], ["First one.", "Second one."])
+
+    def test_identical_text_has_no_changes(self):
+        unchanged, changed = diff_essays(OLD, OLD)
+        self.assertEqual(changed, [])
+        self.assertEqual(unchanged, [(0, len(OLD), 0)])
+
+    def test_whitespace_between_paragraphs_is_not_a_change(self):
+        new = "\n" + OLD.replace("\n\n", "\n\n\n") + "\n"
+        unchanged, changed = diff_essays(OLD, new)
+        self.assertEqual(changed, [])
+        for old_start, old_end, new_start in unchanged:
+            self.assertEqual(OLD[old_start:old_end], new[new_start:new_start + old_end - old_start])
+
+    def test_word_edit_changes_only_its_sentence(self):
+        new = OLD.replace("They says", "They say")
+        unchanged, changed = diff_essays(OLD, new)
+        self.assertEqual(len(changed), 1)
+        old_start, old_end, new_start, new_end = changed[0]
+        self.assertEqual(OLD[old_start:old_end], "They says screens distract students.")
+        self.assertEqual(new[new_start:new_end], "They say screens distract students.")
+        self.assertLess(changed_fraction(OLD, new, changed), 0.3)
+        # The conclusion moved one character to the left.
+        conclusion = OLD.index("In conclusion")
+        self.assertIn(-1, [new_start - old_start for old_start, old_end, new_start in unchanged
+                           if old_start <= conclusion < old_end])
+
+    def test_added_and_removed_paragraphs(self):
+        added = OLD.replace("\n\nIn conclusion", "\n\nOnline courses are cheaper.\n\nIn conclusion")
+        _, changed = diff_essays(OLD, added)
+        self.assertEqual(len(changed), 1)
+        old_start, old_end, new_start, new_end = changed[0]
+        self.assertEqual(old_start, old_end)
+        self.assertEqual(added[new_start:new_end], "Online courses are cheaper.")
+
+        removed = OLD.replace("However, some teachers disagree. They says screens distract students.\n\n", "")
+        _, changed = diff_essays(OLD, removed)
+        self.assertEqual(len(changed), 1)
+        old_start, old_end, new_start, new_end = changed[0]
+        self.assertEqual(new_start, new_end)
+        self.assertEqual(OLD[old_start:old_end], "However, some teachers disagree. They says screens distract students.")
+
+    def test_rewrite_is_mostly_changed(self):
+        new = "Completely different text.\n\nNothing is the same here."
+        _, changed = diff_essays(OLD, new)
+        self.assertGreater(changed_fraction(OLD, new, changed), 0.9)
+
+
+class CarryOverErrorsTest(unittest.TestCase):
+    def test_errors_in_unchanged_text_are_shifted(self):
+        new = "Nowadays, " + OLD.replace("Technology has", "technology has")
+        unchanged, _ = diff_essays(OLD, new)
+        errors = [error(OLD, "balance is important"), error(OLD, "has changed")]
+        kept, dropped = carry_over_errors(errors, OLD, unchanged)
+        self.assertEqual(dropped, 1)
+        self.assertEqual(len(kept), 1)
+        self.assertEqual(new[kept[0]['start']:kept[0]['end']], "balance is important")
+
+    def test_errors_in_edited_sentences_are_dropped(self):
+        new = OLD.replace("They says", "They say")
+        unchanged, _ = diff_essays(OLD, new)
+        kept, dropped = carry_over_errors([error(OLD, "They says", description="agreement")], OLD, unchanged)
+        self.assertEqual((kept, dropped), ([], 1))
+
+    def test_wrong_offsets_are_located_by_text(self):
+        unchanged, _ = diff_essays(OLD, OLD)
+        misplaced = {**error(OLD, "tablets"), 'start': 3, 'end': 10}
+        kept, _ = carry_over_errors([misplaced], OLD, unchanged)
+        self.assertEqual(OLD[kept[0]['start']:kept[0]['end']], "tablets")
+
+    def test_errors_across_unchanged_sentences_survive(self):
+        new = OLD.replace("balance is", "a balance is")
+        unchanged, _ = diff_essays(OLD, new)
+        spanning = error(OLD, "education. Many schools")
+        kept, dropped = carry_over_errors([spanning], OLD, unchanged)
+        self.assertEqual(dropped, 0)
+        self.assertEqual(new[kept[0]['start']:kept[0]['end']], "education. Many schools")
+
+
+class PassagesTest(unittest.TestCase):
+    def test_locate_in_region(self):
+        new = OLD.replace("They says", "They sayz")
+        _, changed = diff_essays(OLD, new)
+        start, end = locate_in_region("sayz", new, changed[0])
+        self.assertEqual(new[start:end], "sayz")
+        start, end = locate_in_region("THEY", new, changed[0])
+        self.assertEqual(new[start:end], "They")
+        self.assertIsNone(locate_in_region("tablets", new, changed[0]))
+        self.assertIsNone(locate_in_region("", new, changed[0]))
+
+    def test_format_passages_marks_new_text_with_context(self):
+        new = OLD.replace("They says", "They say")
+        _, changed = diff_essays(OLD, new)
+        passages = format_passages(OLD, new, changed)
+        self.assertIn("Before: They says screens distract students.", passages)
+        self.assertIn("However, some teachers disagree. >>>They say screens distract students.<<< "
+                      "In conclusion, balance is important.", passages)
+
+    def test_format_passages_for_removed_and_added_text(self):
+        removed = OLD.replace(" Many schools use tablets.", "")
+        self.assertIn("(this text was removed)", format_passages(OLD, removed, diff_essays(OLD, removed)[1]))
+        added = OLD + "\n\nA new paragraph."
+        self.assertIn("(nothing; this text was added)", format_passages(OLD, added, diff_essays(OLD, added)[1]))
+
+
+class AnalyzeRevisionTest(unittest.TestCase):
+    def setUp(self):
+        from essay_analyzer import IELTSEssayAnalyzer
+        from fake_llm import fake_chat_model_factory
+
+        self.analyzer = IELTSEssayAnalyzer(profile="standard", chat_model_factory=fake_chat_model_factory(),
+                                           coalesce_requests=False)
+        self.essay = "\n\n".join([OLD] * 3)
+        self.previous = self.analyzer.analyze_report(self.essay, "Technology in education")
+
+    def assertErrorsMatch(self, report: dict) -> None:
+        for item in report['scores']:
+            for found in item['Errors']:
+                self.assertEqual(report['essay'][found['start']:found['end']], found['error_text'])
+
+    def test_whitespace_only_edit_makes_no_llm_call(self):
+        # Only what the web app keeps of the last analysis; the report must not depend on the rest.
+        previous = {key: self.previous[key] for key in ('essay', 'topic', 'profile', 'scores', 'errors')}
+        report = self.analyzer.analyze_revision(previous, self.essay + "\n", "Technology in education")
+        self.assertEqual(set(report), set(self.previous))
+        self.assertEqual(report['revision']['mode'], 'unchanged')
+        self.assertEqual(report['metrics']['llm_calls'], 0)
+        self.assertEqual(report['scores'][0]['Score'], self.previous['scores'][0]['Score'])
+        self.assertEqual(len(report['errors']), len(self.previous['errors']))
+        self.assertErrorsMatch(report)
+
+    def test_small_edit_is_revised_incrementally(self):
+        report = self.analyzer.analyze_revision(self.previous, self.essay.replace("They says", "They say", 1),
+                                                "Technology in education")
+        self.assertEqual(report['revision']['mode'], 'incremental')
+        self.assertEqual(report['revision']['changed_regions'], 1)
+        self.assertEqual([stage['stage'] for stage in report['metrics']['stages']][0], 'revision')
+        self.assertNotIn('evaluator', [stage['stage'] for stage in report['metrics']['stages']])
+        self.assertErrorsMatch(report)
+
+    def test_large_edit_runs_a_full_analysis(self):
+        report = self.analyzer.analyze_revision(self.previous, "A different essay.\n\nWith other words entirely.",
+                                                "Technology in education")
+        self.assertEqual(report['revision']['mode'], 'full')
+        self.assertIn('evaluator', [stage['stage'] for stage in report['metrics']['stages']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import unittest
+
+from single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def compute(self):
+        self.calls += 1
+        await self.release.wait()
+        return {'scores': [self.calls]}
+
+    async def started(self) -> None:
+        while not self.flight.in_flight():
+            await asyncio.sleep(0)
+
+    async def test_concurrent_callers_share_one_computation(self):
+        leader = asyncio.create_task(self.flight.run("key", self.compute))
+        await self.started()
+        followers = [asyncio.create_task(self.flight.run("key", self.compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+
+        result, shared = await leader
+        self.assertFalse(shared)
+        for follower in followers:
+            self.assertEqual(await follower, ({'scores': [1]}, True))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    async def test_followers_get_copies(self):
+        leader = asyncio.create_task(self.flight.run("key", self.compute))
+        await self.started()
+        follower = asyncio.create_task(self.flight.run("key", self.compute))
+        await asyncio.sleep(0)
+        self.release.set()
+
+        result, _ = await leader
+        copied, _ = await follower
+        copied['scores'].append('changed')
+        self.assertEqual(result, {'scores': [1]})
+
+    async def test_different_keys_and_later_calls_compute_again(self):
+        self.release.set()
+        await self.flight.run("a", self.compute)
+        await self.flight.run("b", self.compute)
+        await self.flight.run("a", self.compute)
+        self.assertEqual(self.calls, 3)
+
+    async def test_followers_get_the_leaders_exception(self):
+        async def fail():
+            await self.release.wait()
+            raise ValueError("evaluator output could not be parsed")
+
+        leader = asyncio.create_task(self.flight.run("key", fail))
+        await self.started()
+        follower = asyncio.create_task(self.flight.run("key", self.compute))
+        await asyncio.sleep(0)
+        self.release.set()
+
+        for task in (leader, follower):
+            with self.assertRaises(ValueError):
+                await task
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    async def test_cancelled_follower_leaves_the_leader_running(self):
+        leader = asyncio.create_task(self.flight.run("key", self.compute))
+        await self.started()
+        follower = asyncio.create_task(self.flight.run("key", self.compute))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+        self.release.set()
+        self.assertEqual(await leader, ({'scores': [1]}, False))
+
+    async def test_follower_takes_over_from_a_cancelled_leader(self):
+        leader = asyncio.create_task(self.flight.run("key", self.compute))
+        await self.started()
+        follower = asyncio.create_task(self.flight.run("key", self.compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.release.set()
+
+        result, shared = await asyncio.wait_for(follower, 1.0)
+        self.assertFalse(shared)
+        self.assertEqual(result, {'scores': [2]})
+
+    async def test_follower_on_another_event_loop(self):
+        leader = asyncio.create_task(self.flight.run("key", self.compute))
+        await self.started()
+        loop = asyncio.get_running_loop()
+        outcome = []
+
+        async def other():
+            follower = asyncio.create_task(self.flight.run("key", self.compute))
+            await asyncio.sleep(0)
+            # Waiting on the leader now; let it finish from its own loop.
+            loop.call_soon_threadsafe(self.release.set)
+            return await follower
+
+        thread = threading.Thread(target=lambda: outcome.append(asyncio.run(other())), daemon=True)
+        thread.start()
+        await asyncio.wait_for(leader, 1.0)
+        await loop.run_in_executor(None, thread.join, 1.0)
+        self.assertEqual(outcome, [({'scores': [1]}, True)])
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
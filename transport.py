@@ -0,0 +1,136 @@
+"""Shared keep-alive HTTP connection pools for the OpenAI chat clients.
+
+Every ChatOpenAI built by ``essay_analyzer.openai_chat_model`` uses the clients
+of one ``HTTPPool``, so the evaluator, suggestion and verifier models (and all
+analyzer instances in the process using the same settings) reuse the same warm
+connections instead of each paying its own TCP/TLS handshakes.
+
+httpx async connections belong to the event loop that opened them, so the async
+side keeps one transport per running loop (``LoopLocalAsyncTransport``). The
+analyzer runs its synchronous API on a single background loop, which therefore
+keeps one long-lived pool.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Tuple
+
+import httpx
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """An ``httpx.AsyncHTTPTransport`` per event loop, created on first use in that loop."""
+
+    def __init__(self, limits: httpx.Limits, retries: int = 0):
+        self.limits = limits
+        self.retries = retries
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits,
+                                                                              retries=self.retries)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the pool of the current loop; pools of other loops are left alone."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _mark_rate_limit_final(response: httpx.Response) -> None:
+    # The OpenAI client obeys this header before its own status-code rules.
+    if response.status_code == 429:
+        response.headers['x-should-retry'] = 'false'
+
+
+async def _amark_rate_limit_final(response: httpx.Response) -> None:
+    _mark_rate_limit_final(response)
+
+
+class HTTPPool:
+    """Sync and async httpx clients sharing one set of limits, timeouts and retry settings.
+
+    ``connect_retries`` retries failed connection attempts inside httpx;
+    ``max_retries`` is handed to the OpenAI client, which retries timeouts and
+    server errors with exponential backoff, and rate limits (429) too unless
+    ``retry_rate_limits`` is False. Analyzers with a RateLimitScheduler use a
+    pool without 429 retries, so the scheduler's backoff is the only one.
+    """
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 120.0,
+                 max_retries: int = 2,
+                 connect_retries: int = 1,
+                 retry_rate_limits: bool = True):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_rate_limits = retry_rate_limits
+        hooks = {} if retry_rate_limits else {'response': [_mark_rate_limit_final]}
+        async_hooks = {} if retry_rate_limits else {'response': [_amark_rate_limit_final]}
+        self.client = httpx.Client(timeout=self.timeout, event_hooks=hooks,
+                                   transport=httpx.HTTPTransport(limits=self.limits, retries=connect_retries))
+        self.async_client = httpx.AsyncClient(timeout=self.timeout, event_hooks=async_hooks,
+                                              transport=LoopLocalAsyncTransport(self.limits, retries=connect_retries))
+
+    def chat_model_options(self) -> Dict[str, Any]:
+        """Keyword arguments wiring a ChatOpenAI to this pool."""
+        return {
+            'http_client': self.client,
+            'http_async_client': self.async_client,
+            'max_retries': self.max_retries,
+            'timeout': self.timeout,
+        }
+
+    async def awarm_up(self, base_url: str = DEFAULT_BASE_URL, connections: int = 2) -> int:
+        """Open ``connections`` keep-alive connections in the current loop's pool.
+
+        Any HTTP response counts, as only the connection matters; returns how many succeeded.
+        """
+        async def touch() -> bool:
+            try:
+                await self.async_client.head(base_url)
+                return True
+            except httpx.HTTPError as e:
+                print(f"Warm-up request to {base_url} failed: {e}")
+                return False
+
+        results = await asyncio.gather(*(touch() for _ in range(max(1, connections))))
+        return sum(results)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+_shared_pools: Dict[Tuple[Tuple[str, Any], ...], HTTPPool] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pool(**settings: Any) -> HTTPPool:
+    """The process-wide HTTPPool for ``settings`` (see HTTPPool), created on first use."""
+    key = tuple(sorted(settings.items()))
+    with _shared_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = _shared_pools[key] = HTTPPool(**settings)
+        return pool